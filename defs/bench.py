@@ -0,0 +1,167 @@
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from timeit import default_timer
+from defaults import *
+
+# Times Ecosystem.cycle and each of its phases, so changes to the simulation
+# can be measured.  Usage from the game folder:
+#   python -m defs.bench --save bench.json        (record a baseline)
+#   python -m defs.bench --baseline bench.json    (compare against it)
+#
+# Each scenario varies one of the number of organisms in the ecosystem, the
+# number of operons in each genome, or the number of resources the genomes
+# can transport, around a base scenario.
+
+BASE = {'orgs': 1, 'operons': 8, 'resources': 6}
+CURVES = {'orgs': [1, 4, 16, 64],
+          'operons': [0, 8, 32, 128],
+          'resources': [0, 6, 15]}
+
+# The phases timed individually, in the order they run in a cycle.
+# 'pool' is the environment mixing step of the cycle.
+PHASES = ['setChannels', 'resAvailable', 'pool', 'diffuseRes', 'partition',
+          'exchangeRes', 'update', 'convertRes', 'divide']
+
+# Returns a genome with the hidden genes, the given number of catalog operons
+# (cycling through the catalog, always including a DNA polymerase so cells
+# can grow), and a channel and transporter for each of the first `resources`
+# environmental resources.
+def benchGenome(operonCount, resources):
+    catalog = sorted(displayedGenes, key=lambda op: op.name)
+    ops = list(hiddenGenes)
+    if operonCount:
+        ops.append(operons['DNA Polymerase'])
+    for i in range(operonCount - 1):
+        ops.append(catalog[i % len(catalog)])
+    for r in RESOURCES[:resources]:
+        ops.append(Operon(r + ' Bench Channel', 100000, 'pas', r))
+        ops.append(Operon(r + ' Bench Transporter', 100000, 'act', r, 0.5))
+    return Genome(ops)
+
+def benchEcosystem(orgs, operons, resources):
+    community = []
+    for i in range(orgs):
+        genome = benchGenome(operons, resources)
+        community.append(Organism('Bench ' + str(i), genome, cellTolerances))
+    return Ecosystem(community, Environment('Bench', 1, ENVR))
+
+# Replaces a method on one object with a wrapper that adds its running time
+# to totals[phase].
+def timeMethod(obj, name, phase, totals):
+    method = getattr(obj, name)
+    def timed(*args):
+        start = default_timer()
+        result = method(*args)
+        totals[phase] += default_timer() - start
+        return result
+    setattr(obj, name, timed)
+
+# Runs a scenario and returns its cycles per second and the microseconds spent
+# in each phase per cycle.  Each measurement is the best of `repeat` runs of
+# `cycles` cycles, each starting from a fresh ecosystem.
+def runScenario(orgs, operons, resources, cycles=60, repeat=3):
+    best = None
+    for i in range(repeat):
+        eco = benchEcosystem(orgs, operons, resources)
+        start = default_timer()
+        for c in range(cycles):
+            eco.cycle()
+        elapsed = default_timer() - start
+        if best == None or elapsed < best:
+            best = elapsed
+
+    phases = None
+    for i in range(repeat):
+        totals = dict([(p, 0.0) for p in PHASES])
+        eco = benchEcosystem(orgs, operons, resources)
+        for org in eco.orgs:
+            for p in ('setChannels', 'resAvailable', 'diffuseRes', 'exchangeRes', 'convertRes', 'divide'):
+                timeMethod(org, p, p, totals)
+        timeMethod(eco.env, 'partition', 'partition', totals)
+        timeMethod(eco.env, 'update', 'update', totals)
+        timeMethod(eco, 'poolRes', 'pool', totals)
+        for c in range(cycles):
+            eco.cycle()
+        if phases == None:
+            phases = totals
+        else:
+            for p in PHASES:
+                phases[p] = min(phases[p], totals[p])
+
+    return {'cyclesPerSec': cycles / best,
+            'phases': dict([(p, phases[p] / cycles * 10**6) for p in PHASES])}
+
+def scenarioName(params):
+    return ' '.join(['%s=%d' % (k, params[k]) for k in sorted(params)])
+
+def runSuite(cycles=60, repeat=3):
+    scenarios = {}
+    for key in sorted(CURVES):
+        for value in CURVES[key]:
+            params = dict(BASE)
+            params[key] = value
+            name = scenarioName(params)
+            if name not in scenarios:
+                scenarios[name] = runScenario(cycles=cycles, repeat=repeat, **params)
+                scenarios[name].update(params)
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'scenarios': scenarios}
+
+# Compares results against a baseline and returns a list of regression
+# messages for cycle rates that fell, or phases that slowed, by more than
+# the given fraction.
+def compare(results, baseline, tolerance=0.25):
+    regressions = []
+    for name, new in sorted(results['scenarios'].items()):
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        if new['cyclesPerSec'] < old['cyclesPerSec'] * (1 - tolerance):
+            regressions.append('%s: %.0f cycles/sec, was %.0f' %
+                               (name, new['cyclesPerSec'], old['cyclesPerSec']))
+        for p in PHASES:
+            # Ignore phases too short to time reliably.
+            if old['phases'][p] > 1.0 and new['phases'][p] > old['phases'][p] * (1 + tolerance):
+                regressions.append('%s: %s took %.1f us, was %.1f us' %
+                                   (name, p, new['phases'][p], old['phases'][p]))
+    return regressions
+
+def printResults(results):
+    print 'scenario'.ljust(34) + 'cycles/s'.rjust(10) + ''.join([p[:10].rjust(11) for p in PHASES])
+    for name, r in sorted(results['scenarios'].items()):
+        print name.ljust(34) + ('%.0f' % r['cyclesPerSec']).rjust(10) + \
+              ''.join([('%.1f' % r['phases'][p]).rjust(11) for p in PHASES])
+    print '(phase times are microseconds per cycle)'
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the ecosystem simulation.')
+    parser.add_argument('--cycles', type=int, default=60, help='cycles per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, best is kept')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before flagging a regression (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    results = runSuite(args.cycles, args.repeat)
+    printResults(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print 'REGRESSION ' + message
+        if regressions:
+            sys.exit(1)
+        print 'No regressions against ' + args.baseline
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+from constants import NENV
+from run import buildEcosystem, simulate, TIME_LIMIT
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Remembers the results of runs on disk, so a run that has been done before,
+# by any program on this machine, is returned at once instead of simulated:
+#   cache = ResultCache()
+#   result = simulateCached(cache, ['Glucose Transporter', 'DNA Polymerase'])
+#
+# Runs are deterministic, so a result is keyed by a hash of everything that
+# decides it: the operons in the order they were added (with their full
+# definitions, so editing the catalog misses the cache), the environment,
+# the cell's starting state and tolerances, the run length and fast-forward.
+# Bump MODEL_VERSION whenever the simulation's rules change.
+#
+# Each result is a small JSON file named by its key.  Files are written
+# beside their final name and renamed into place, so readers never see half
+# a file, and reading a result touches its modification time, which makes
+# eviction least recently used.  When the cache grows past its size limit,
+# the oldest files are removed while holding a lock on the cache folder.
+
+MODEL_VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.organism-trail', 'cache')
+DEFAULT_SIZE = 64 * 2**20
+# Eviction scans the folder, so only check the size after this many writes.
+EVICT_EVERY = 64
+
+
+# Returns the hex key of a run of a freshly built ecosystem.
+def runKey(eco, minutes, fastForward=False):
+    org = eco.orgs[0]
+    description = {'model': MODEL_VERSION,
+                   'operons': [(op.name, op.size, op.func, repr(op.eff), op.atpReq)
+                               for op in org.genes.operons],
+                   'env': [repr(c) for c in eco.env.res[:NENV]] + [repr(eco.env.vol)],
+                   'cell': [repr(c) for c in org.res] + [repr(org.count), repr(org.cVol)],
+                   'tolerances': [[repr(c) for c in bound] for bound in org.tol.bounds],
+                   'minutes': minutes,
+                   'fastForward': bool(fastForward)}
+    return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+
+class ResultCache:
+    """A size-bounded, least recently used cache of run results on disk, shared between processes"""
+
+    def __init__(self, path=DEFAULT_DIR, maxBytes=DEFAULT_SIZE):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.writes = 0
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # Another process may have just made it.
+                if not os.path.isdir(path):
+                    raise
+
+    def file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    # Returns the result stored under key, or None.
+    def get(self, key):
+        try:
+            with open(self.file(key)) as f:
+                result = json.load(f)
+            os.utime(self.file(key), None)
+            return result
+        except (IOError, OSError, ValueError):
+            return None
+
+    # Stores the result of run.simulate() for the ecosystem it ran, adding
+    # the counts over the run from its tracker.
+    def putRun(self, key, eco, result):
+        result = dict(result)
+        result['trajectory'] = [[m, c] for m, c in eco.tracker[eco.orgs[0]].history()] + \
+                               [[result['time'], result['count']]]
+        self.put(key, result)
+        return result
+
+    def put(self, key, result):
+        tmp = self.file(key) + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.rename(tmp, self.file(key))
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    # Removes the least recently used results until the cache is under its
+    # size limit.  Only one process evicts at a time.
+    def evict(self):
+        with open(os.path.join(self.path, 'lock'), 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for name in os.listdir(self.path):
+                if name.endswith('.json'):
+                    try:
+                        st = os.stat(os.path.join(self.path, name))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, name))
+                    total += st.st_size
+            entries.sort()
+            for mtime, size, name in entries:
+                if total <= self.maxBytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+                total -= size
+
+
+# The same as run.simulate(buildEcosystem(geneNames, envRes), ...), but
+# returns the cached result when there is one.  Results are stored with the
+# counts over the run as [minute, count] pairs under 'trajectory', which is
+# left out of the returned result unless trajectory is set.
+def simulateCached(cache, geneNames, envRes=None, minutes=TIME_LIMIT, fastForward=False,
+                   trajectory=False):
+    eco = buildEcosystem(geneNames, envRes)
+    key = runKey(eco, minutes, fastForward)
+    result = cache.get(key)
+    if result == None:
+        result = cache.putRun(key, eco, simulate(eco, minutes, fastForward))
+    if not trajectory:
+        del result['trajectory']
+    return result
+
+
+# The cache used by the jobs of this process, set by initWorker.
+worker = None
+
+# Opens the cache at path, or none if path is None, for the jobs this
+# process runs.  Pools pass this as their initializer, so each worker keeps
+# one ResultCache, and one count of its writes, instead of one per job.
+def initWorker(path):
+    global worker
+    worker = ResultCache(path) if path else None
+
+# Runs one job of a process set up by initWorker, using its cache if it has
+# one.  Returns the result of run.simulate().
+def simulateJob(geneNames, envRes=None, minutes=TIME_LIMIT, fastForward=False):
+    if worker:
+        return simulateCached(worker, geneNames, envRes, minutes, fastForward)
+    return simulate(buildEcosystem(geneNames, envRes), minutes, fastForward)
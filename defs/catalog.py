@@ -0,0 +1,228 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict
+from timeit import default_timer
+from constants import ENVR, OPTYPES, RESOURCES, RIDX, BOUNDS
+from objects import Reaction, Operon
+
+# The reactions, operons and environment presets of the game, loaded from a
+# JSON file (data/catalog.json, or the file named by ORGANISM_TRAIL_CATALOG):
+#   {"reactions": {"ATP Hydrolysis": {"reactants": {"ATP": 1},
+#                                     "products": {"ADP": 1, "P": 1}}, ...},
+#    "operons": [{"name": "Glucose Transporter", "size": 100000, "type": "act",
+#                 "effect": "Glc", "atpReq": 1, "rate": null}, ...],
+#    "environments": {"Lab": {}, "Pond": {"O2": 0.01}, ...}}
+# An operon's effect is an environmental resource for 'pas' and 'act', a
+# reaction's name for 'rxn', [resource, bound, offset] for 'mod' and a special
+# string for 'misc'; atpReq and rate are optional.  Environments give their
+# differences from ENVR.  Operons are listed in the order the game shows them.
+#
+# A catalog is checked once and compiled to plain tuples, with the resource
+# indices and moles of every reaction worked out, then saved with marshal
+# beside its source (catalog.json -> catalog.cache).  The cache is keyed by a
+# hash of the source, so editing the catalog compiles it again; loading from
+# the cache is just unmarshalling and building the objects.  To check a
+# catalog and see how long it takes to load:
+#   python -m defs.catalog data/catalog.json
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DEFAULT_PATH = os.environ.get('ORGANISM_TRAIL_CATALOG') or os.path.join(DATA_DIR, 'catalog.json')
+MAGIC = 'OTCC'
+# Bump whenever the compiled form or the checks change.
+COMPILER_VERSION = 3
+
+
+# JSON strings are unicode, but the rest of the game uses str.
+def text(s, where):
+    if not isinstance(s, basestring):
+        raise ValueError(where + " must be a string.")
+    return s.encode('utf-8')
+
+def number(n, where):
+    if isinstance(n, bool) or not isinstance(n, (int, long, float)):
+        raise ValueError(where + " must be a number.")
+    return n
+
+# Moles and sizes are divided by, so they must be above zero.
+def positive(n, where):
+    if number(n, where) <= 0:
+        raise ValueError(where + " must be positive.")
+    return n
+
+def resource(r, where, resources=RIDX):
+    r = text(r, where)
+    if r in RIDX and r not in resources:
+        raise ValueError(where + " must be a resource outside the cell: " + r)
+    if r not in resources:
+        raise ValueError(where + " is not a known resource: " + r)
+    return r
+
+def table(d, where):
+    if not isinstance(d, dict):
+        raise ValueError(where + " must be an object.")
+    return d.items()
+
+
+# Checks the JSON source of a catalog and compiles it, raising ValueError
+# if anything is wrong.  name is used in the error messages.
+def compileCatalog(source, name='catalog'):
+    try:
+        data = json.loads(source, object_pairs_hook=OrderedDict)
+    except ValueError as e:
+        raise ValueError(name + ": " + str(e))
+    try:
+        table(data, "The catalog")
+
+        # Reactions are (name, reactants, products, (reactant indices,
+        # reactant moles, product indices, product moles)), with the
+        # reactants and products as (resource, moles) pairs in file order.
+        reactions = []
+        for rxnName, rxn in table(data.get('reactions', {}), "reactions"):
+            where = "reaction '" + text(rxnName, "A reaction's name") + "'"
+            table(rxn, where)
+            sides = []
+            for side in ('reactants', 'products'):
+                sides.append([(resource(r, where + " " + side), positive(m, where + " moles of " + r))
+                              for r, m in table(rxn.get(side, {}), where + " " + side)])
+            compiled = Reaction(dict(sides[0]), dict(sides[1]))
+            reactions.append((text(rxnName, where), sides[0], sides[1],
+                              (compiled.reacIdx, compiled.reacMol, compiled.prodIdx, compiled.prodMol)))
+        rxnNames = set([rxn[0] for rxn in reactions])
+
+        # Operons are (name, size, type, effect, atpReq, rate).
+        operons = []
+        names = set()
+        ops = data.get('operons', [])
+        if not isinstance(ops, list):
+            raise ValueError("operons must be a list.")
+        for op in ops:
+            table(op, "Each operon")
+            opName = text(op.get('name'), "An operon's name")
+            where = "operon '" + opName + "'"
+            if opName in names:
+                raise ValueError(where + " is defined twice.")
+            names.add(opName)
+            func = text(op.get('type'), where + " type")
+            if func not in OPTYPES:
+                raise ValueError(where + " type must be one of " + ', '.join(OPTYPES) + ".")
+            effect = op.get('effect')
+            # Transporters exchange with the environment, so they can only
+            # move resources that are found outside the cell.
+            if func in ('pas', 'act'):
+                effect = resource(effect, where + " effect", ENVR)
+            elif func == 'rxn':
+                effect = text(effect, where + " effect")
+                if effect not in rxnNames:
+                    raise ValueError(where + " catalyzes an unknown reaction: " + effect)
+            elif func == 'mod':
+                if not isinstance(effect, list) or len(effect) != 3:
+                    raise ValueError(where + " effect must be [resource, bound, offset].")
+                bound = text(effect[1], where + " bound")
+                if bound not in BOUNDS:
+                    raise ValueError(where + " bound must be one of " + ', '.join(BOUNDS) + ".")
+                effect = (resource(effect[0], where + " effect"), bound, number(effect[2], where + " offset"))
+            else:
+                effect = text(effect, where + " effect")
+            rate = op.get('rate')
+            if rate != None:
+                rate = number(rate, where + " rate")
+            operons.append((opName, positive(op.get('size'), where + " size"), func, effect,
+                            number(op.get('atpReq', 0), where + " atpReq"), rate))
+
+        # Environments are (name, (resource, concentration) pairs).
+        environments = []
+        for envName, res in table(data.get('environments', {}), "environments"):
+            where = "environment '" + text(envName, "An environment's name") + "'"
+            environments.append((text(envName, where),
+                                 [(resource(r, where, ENVR), number(c, where + " " + r))
+                                  for r, c in table(res, where)]))
+    except ValueError as e:
+        raise ValueError(name + ": " + str(e))
+
+    return {'reactions': reactions, 'operons': operons, 'environments': environments}
+
+
+class Catalog:
+    """The reactions, operons and environments built from a compiled catalog"""
+
+    def __init__(self, compiled):
+        self.reactions = {}
+        for name, reactants, products, stoichiometry in compiled['reactions']:
+            self.reactions[name] = Reaction(dict(reactants), dict(products), stoichiometry)
+        # operons maps names to operons, and order lists them as in the file.
+        self.operons = {}
+        self.order = []
+        for name, size, func, effect, atpReq, rate in compiled['operons']:
+            if func == 'rxn':
+                effect = self.reactions[effect]
+            op = Operon(name, size, func, effect, atpReq, rate)
+            self.operons[name] = op
+            self.order.append(op)
+        self.environments = dict([(name, dict(res)) for name, res in compiled['environments']])
+
+
+def cachePath(path):
+    return os.path.splitext(path)[0] + '.cache'
+
+# Returns the compiled catalog saved at path under key, or None.
+def readCache(path, key):
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC or f.read(len(key)) != key:
+                return None
+            return marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+# Saves a compiled catalog, if the folder can be written to.
+def writeCache(path, key, compiled):
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + key)
+            marshal.dump(compiled, f)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# Loads the catalog at path, from its compiled cache if it is up to date.
+def load(path=DEFAULT_PATH):
+    with open(path, 'rb') as f:
+        source = f.read()
+    # The indices depend on the resources, so a change to them also misses.
+    key = hashlib.sha1(str(COMPILER_VERSION) + repr(RESOURCES) + source).hexdigest()
+    compiled = readCache(cachePath(path), key)
+    if compiled == None:
+        compiled = compileCatalog(source, path)
+        writeCache(cachePath(path), key, compiled)
+    return Catalog(compiled)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Check and compile a catalog of reactions, operons and environments.')
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.path, 'rb') as f:
+            start = default_timer()
+            compileCatalog(f.read(), args.path)
+        compileTime = default_timer() - start
+    except (IOError, ValueError) as e:
+        print >>sys.stderr, e
+        sys.exit(1)
+    load(args.path)
+    start = default_timer()
+    catalog = load(args.path)
+    print "%d reactions, %d operons, %d environments" % \
+          (len(catalog.reactions), len(catalog.operons), len(catalog.environments))
+    print "Compiling took %.1f ms, loading from %s took %.1f ms" % \
+          (compileTime * 1000, cachePath(args.path), (default_timer() - start) * 1000)
+
+if __name__ == '__main__':
+    main()
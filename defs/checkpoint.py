@@ -0,0 +1,189 @@
+import os
+import struct
+import sys
+from array import array
+from constants import *
+from objects import Genome, Organism, Environment, Ecosystem, Tracker, tolerances
+
+# Saves and restores the full state of an Ecosystem mid-run, so long jobs can
+# be resumed and sweeps can start from shared pre-warmed states:
+#   checkpoint.save(eco, 'run.ckpt')
+#   eco = checkpoint.load('run.ckpt')
+#
+# The file is a small header followed by little-endian binary fields.  Every
+# resource vector is stored as a packed array of doubles, and the resource
+# names are stored so a checkpoint can't be loaded against a different layout.
+# Genomes are stored as lists of operon names, looked up again on load, and
+# genomes and tolerance tables shared between organisms are stored once.
+
+MAGIC = 'OTCK'
+VERSION = 2
+
+
+class Writer:
+    """Writes the binary fields of a checkpoint"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def pack(self, fmt, *values):
+        self.f.write(struct.pack('<' + fmt, *values))
+
+    def string(self, s):
+        s = s.encode('utf-8')
+        self.pack('I', len(s))
+        self.f.write(s)
+
+    def doubles(self, values):
+        a = array('d', values)
+        if sys.byteorder == 'big':
+            a.byteswap()
+        self.pack('I', len(a))
+        self.f.write(a.tostring())
+
+
+class Reader:
+    """Reads the binary fields written by Writer"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise ValueError("Checkpoint is truncated.")
+        return data
+
+    def unpack(self, fmt):
+        fmt = '<' + fmt
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))
+
+    def string(self):
+        n, = self.unpack('I')
+        return self.read(n).decode('utf-8')
+
+    def doubles(self):
+        n, = self.unpack('I')
+        a = array('d')
+        a.fromstring(self.read(8 * n))
+        if sys.byteorder == 'big':
+            a.byteswap()
+        return a.tolist()
+
+
+# Writes the ecosystem to path.  The file is written beside it first and then
+# renamed, so an interrupted save never leaves a broken checkpoint behind.
+def save(eco, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(eco, Writer(f))
+    os.rename(tmp, path)
+
+def write(eco, w):
+    w.f.write(MAGIC)
+    w.pack('H', VERSION)
+    w.pack('I', len(RESOURCES))
+    for r in RESOURCES:
+        w.string(r)
+
+    w.string(eco.env.name)
+    w.pack('d', eco.env.vol)
+    w.doubles(eco.env.res)
+    w.pack('?I', eco.fastForward, eco.steady)
+
+    # Organisms may share a genome, which also shares its channel states, so
+    # each distinct genome is written once and referred to by position.
+    genomes = []
+    position = {}
+    for org in eco.orgs:
+        if id(org.genes) not in position:
+            position[id(org.genes)] = len(genomes)
+            genomes.append(org.genes)
+    w.pack('I', len(genomes))
+    for genome in genomes:
+        ops = genome.operons
+        w.pack('I', len(ops))
+        for op in ops:
+            w.string(op.name)
+        w.f.write(''.join(['\x01' if o else '\x00' for o in genome.isOpen]))
+
+    tables = []
+    for org in eco.orgs:
+        if org.tol not in tables:
+            tables.append(org.tol)
+    w.pack('I', len(tables))
+    for tol in tables:
+        w.doubles(tol.current)
+        for bound in tol.bounds:
+            w.doubles(bound)
+
+    w.pack('I', len(eco.orgs))
+    for org in eco.orgs:
+        w.string(org.name)
+        w.pack('IIdd', position[id(org.genes)], tables.index(org.tol), org.count, org.cVol)
+        w.doubles(org.res)
+        t = eco.tracker[org]
+        w.pack('IIII', t.size, t.n, t.stride, t.archiveSize)
+        w.doubles(t.ring)
+        w.doubles(t.archive)
+
+# Reads an ecosystem back from path.  catalog maps operon names to operons,
+# defaulting to defaults.operons.
+def load(path, catalog=None):
+    with open(path, 'rb') as f:
+        return read(Reader(f), catalog)
+
+def read(r, catalog=None):
+    if catalog == None:
+        from defaults import operons as catalog
+    if r.read(4) != MAGIC:
+        raise ValueError("Not a checkpoint file.")
+    version, = r.unpack('H')
+    if version != VERSION:
+        raise ValueError("Unsupported checkpoint version " + str(version) + ".")
+    n, = r.unpack('I')
+    if [r.string() for i in range(n)] != RESOURCES:
+        raise ValueError("Checkpoint was saved with a different set of resources.")
+
+    env = Environment(r.string(), r.unpack('d')[0], ENVR)
+    env.res = r.doubles()
+    fastForward, steady = r.unpack('?I')
+
+    genomes = []
+    for g in range(r.unpack('I')[0]):
+        names = [r.string() for i in range(r.unpack('I')[0])]
+        try:
+            genome = Genome([catalog[name] for name in names])
+        except KeyError as e:
+            raise ValueError("Checkpoint uses an unknown operon: " + e.args[0])
+        genome.isOpen = [c == '\x01' for c in r.read(len(RESOURCES))]
+        genomes.append(genome)
+
+    tables = []
+    for t in range(r.unpack('I')[0]):
+        current = tuple(r.doubles())
+        tables.append(tolerances(current, tuple([tuple(r.doubles()) for b in BOUNDS])))
+
+    orgs = []
+    trackers = []
+    for o in range(r.unpack('I')[0]):
+        name = r.string()
+        g, tol, count, cVol = r.unpack('IIdd')
+        # The saved table already has the genome's mods applied.
+        org = Organism(name, genomes[g], tables[tol], count, cVol, modsApplied=True)
+        org.res = r.doubles()
+        org.updateStatus()
+        size, appended, stride, archiveSize = r.unpack('IIII')
+        t = Tracker(size, archiveSize)
+        t.n = appended
+        t.stride = stride
+        t.ring = array('d', r.doubles())
+        t.archive = array('d', r.doubles())
+        orgs.append(org)
+        trackers.append(t)
+
+    eco = Ecosystem(orgs, env)
+    eco.tracker = dict(zip(orgs, trackers))
+    eco.fastForward = fastForward
+    eco.steady = steady
+    return eco
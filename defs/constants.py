@@ -133,4 +133,18 @@ DIFFUSES = ['CO2', 'O2', 'EtOH', 'Lux', 'Temp']
 
 # There are several basic functions of operons, passive/active transporters,
 # modifiers, and reaction catalysts.
-OPTYPES = ['pas', 'act', 'mod', 'rxn', 'misc']
\ No newline at end of file
+OPTYPES = ['pas', 'act', 'mod', 'rxn', 'misc']
+
+# Every resource has a fixed position in the resource vectors used by the
+# simulation.  Environmental resources come first, so an environment's vector
+# lines up with the start of a cell's vector.
+RESOURCES = sorted(ENVR) + sorted([r for r in CELLR if r not in ENVR])
+RIDX = dict([(r, i) for i, r in enumerate(RESOURCES)])
+NENV = len(ENVR)
+
+# The tolerance bounds that each cellular resource has, from lowest to highest.
+BOUNDS = ['minLive', 'minGrow', 'ideal', 'maxGrow', 'maxLive']
+
+# Where a concentration sits relative to an organism's tolerance bounds.
+DYING_LOW, LIMITED_LOW, GROWING, LIMITED_HIGH, DYING_HIGH = range(5)
+STATUSES = ['dying-low', 'limited-low', 'growing', 'limited-high', 'dying-high']
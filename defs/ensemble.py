@@ -0,0 +1,108 @@
+import random
+from argparse import ArgumentParser
+from constants import NENV
+from run import buildEcosystem, TIME_LIMIT
+
+# Runs many seeded replicates of one ecosystem with stochastic division, to
+# see how much the outcome varies.  Usage from the game folder:
+#   python -m defs.ensemble --genes "Glucose Transporter,Alcohol Fermentation" \
+#       --replicates 100 --seed 1 --env-noise 0.05
+#
+# In each replicate the births and deaths of every minute are drawn around
+# the numbers the deterministic model expects (see Organism.divide), and the
+# starting environment can be perturbed.  The replicates advance together a
+# minute at a time, and each minute is reduced to a summary of the cell
+# counts across them, so memory doesn't grow with the number of minutes.
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+# Returns the q quantile of a sorted list, interpolating between neighbours.
+def quantile(values, q):
+    pos = q * (len(values) - 1)
+    low = int(pos)
+    if low + 1 >= len(values):
+        return values[-1]
+    return values[low] + (values[low + 1] - values[low]) * (pos - low)
+
+
+class Ensemble:
+    """Seeded replicates of an ecosystem with stochastic division, summarized each minute"""
+
+    # build is a function returning a fresh Ecosystem, called once per
+    # replicate.  Every starting environmental concentration is multiplied
+    # by a draw from a normal distribution with mean 1 and standard
+    # deviation envNoise.  The same seed gives the same results.
+    def __init__(self, build, replicates=100, seed=None, envNoise=0.0):
+        master = random.Random(seed)
+        self.replicates = []
+        for k in range(replicates):
+            rng = random.Random(master.getrandbits(64))
+            eco = build()
+            if envNoise:
+                for i in range(NENV):
+                    eco.env.res[i] *= max(0.0, rng.gauss(1.0, envNoise))
+            for org in eco.orgs:
+                org.rng = rng
+                org.count = float(round(org.count))
+            self.replicates.append(eco)
+        self.minute = 0
+
+    # Returns the total number of cells in each replicate.
+    def counts(self):
+        return [sum([org.count for org in eco.orgs]) for eco in self.replicates]
+
+    # Runs one minute of every replicate, and returns its summary.
+    # Populations that die out are taken out of their ecosystem.
+    def step(self):
+        for eco in self.replicates:
+            if eco.orgs:
+                eco.cycle()
+                for org in [org for org in eco.orgs if org.count <= 0]:
+                    eco.remove(org)
+        self.minute += 1
+        return self.summary()
+
+    # Summarizes the cell counts across the replicates: their mean, the
+    # QUANTILES, and the fraction of replicates with no cells left.
+    def summary(self):
+        counts = sorted(self.counts())
+        return {'minute': self.minute,
+                'mean': sum(counts) / float(len(counts)),
+                'quantiles': dict([(q, quantile(counts, q)) for q in QUANTILES]),
+                'extinct': len([c for c in counts if c <= 0]) / float(len(counts))}
+
+    # Runs the given number of minutes, returning the summary of each.
+    def run(self, minutes=TIME_LIMIT):
+        return [self.step() for m in range(minutes)]
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Run seeded replicates of the simulation with stochastic division.')
+    parser.add_argument('--genes', default='',
+                        help='comma separated operon names, in the order they are added')
+    parser.add_argument('--replicates', type=int, default=100)
+    parser.add_argument('--minutes', type=int, default=TIME_LIMIT)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--env-noise', type=float, default=0.0,
+                        help='relative standard deviation of the starting environment (default %(default)s)')
+    parser.add_argument('--every', type=int, default=10,
+                        help='print one minute in this many (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    geneNames = [name.strip() for name in args.genes.split(',') if name.strip()]
+    try:
+        buildEcosystem(geneNames)
+    except ValueError as e:
+        parser.error(str(e))
+    ensemble = Ensemble(lambda: buildEcosystem(geneNames), args.replicates, args.seed, args.env_noise)
+
+    print "minute\tmean\t" + '\t'.join(['q%g' % (q * 100) for q in QUANTILES]) + "\textinct"
+    for m in range(args.minutes):
+        s = ensemble.step()
+        if s['minute'] % args.every == 0 or s['minute'] == args.minutes:
+            print str(s['minute']) + "\t%.1f\t" % s['mean'] + \
+                  '\t'.join(['%.1f' % s['quantiles'][q] for q in QUANTILES]) + "\t%.2f" % s['extinct']
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+from array import array
+from multiprocessing import Pipe, Process, cpu_count
+from operator import add, sub, mul
+from constants import *
+from objects import Ecosystem, Environment
+
+# The fraction of the concentration difference between neighbouring patches
+# that diffuses across each minute.  Light doesn't diffuse between patches;
+# it is set per patch, e.g. falling off with depth.
+DIFFUSION_RATES = dict([(r, 0.1) for r in RESOURCES[:NENV]])
+DIFFUSION_RATES['Lux'] = 0.0
+
+
+# Runs the cycles of a block of patches in a worker process.  Each minute
+# the grid sends the block's environments as one array of doubles, and gets
+# them back after the cycles.  'counts' returns the number of cells in each
+# patch, and 'stop' sends the patches themselves back and ends the worker.
+def runBlock(conn, patches):
+    while True:
+        command, data = conn.recv()
+        if command == 'cycle':
+            res = array('d')
+            res.fromstring(data)
+            for k, eco in enumerate(patches):
+                eco.env.res = res[k * NENV:(k + 1) * NENV].tolist()
+                eco.cycle()
+            conn.send(array('d', [c for eco in patches for c in eco.env.res]).tostring())
+        elif command == 'counts':
+            conn.send([sum([org.count for org in eco.orgs]) for eco in patches])
+        else:
+            conn.send(patches)
+            conn.close()
+            return
+
+
+class Grid:
+    """A 2-D or 3-D grid of patches, each an ecosystem, which exchange resources by diffusion"""
+
+    # shape is a tuple of the number of patches along each axis.  Every patch
+    # starts with its own environment of volume vol and resources res (a
+    # dictionary like ENVR).  rates overrides DIFFUSION_RATES per resource.
+    # processes is how many worker processes share the patches' cycles; 1
+    # runs them in this process, and None uses every core.
+    def __init__(self, shape, res=ENVR, vol=1, rates=None, name='Grid', processes=1):
+        if len(shape) not in (2, 3):
+            raise ValueError("Grids must be 2-D or 3-D.")
+        self.shape = tuple(shape)
+        self.size = reduce(mul, self.shape)
+        self.patches = [Ecosystem([], Environment(name + ' ' + str(self.position(p)), vol, res))
+                        for p in range(self.size)]
+        self.processes = processes or cpu_count()
+        # While workers are running, (process, connection, patch indices) for
+        # each.  They hold the live populations of those patches, while the
+        # environments stay here for diffusion.
+        self.blocks = None
+
+        self.rates = dict(DIFFUSION_RATES)
+        if rates:
+            self.rates.update(rates)
+        for r in self.rates:
+            # The explicit stencil is only stable up to this rate.
+            if not 0 <= self.rates[r] <= 1.0 / (2 * len(self.shape)):
+                raise ValueError("Diffusion rate for " + r + " must be between 0 and " +
+                                 str(1.0 / (2 * len(self.shape))))
+
+        # Patches are stored in row-major order.  For each axis keep the
+        # stride between neighbours along it, and a weight per patch that is
+        # zero where the patch is the last along that axis, so no resources
+        # flow across the grid's edges.
+        self.axes = []
+        stride = 1
+        for length in reversed(self.shape):
+            last = [(p // stride) % length == length - 1 for p in range(self.size - stride)]
+            self.axes.append((stride, [0.0 if l else 1.0 for l in last]))
+            stride *= length
+
+        # Pre-multiply the weights by each resource's rate.
+        self.weights = []
+        for i in range(NENV):
+            rate = self.rates[RESOURCES[i]]
+            self.weights.append([(s, [w * rate for w in mask]) for s, mask in self.axes])
+
+    # Converts between a patch's position tuple and its index in patches.
+    def index(self, pos):
+        p = 0
+        for x, length in zip(pos, self.shape):
+            if not 0 <= x < length:
+                raise IndexError("Position " + str(pos) + " is outside the grid.")
+            p = p * length + x
+        return p
+
+    def position(self, p):
+        pos = []
+        for length in reversed(self.shape):
+            pos.append(p % length)
+            p //= length
+        return tuple(reversed(pos))
+
+    # Returns the ecosystem at pos, bringing its populations back from the
+    # workers first if they are running.
+    def patch(self, pos):
+        self.stop()
+        return self.patches[self.index(pos)]
+
+    # Places an organism population in the patch at pos.  It gets its own
+    # channel state, so populations sharing a genome in different patches
+    # open and close their channels independently.
+    def place(self, pos, org):
+        org.genes = org.genes.copy()
+        self.patch(pos).add(org)
+
+    # Sets the concentration of resource r in the patch at pos.
+    def setRes(self, pos, r, conc):
+        self.patches[self.index(pos)].env.res[RIDX[r]] = float(conc)
+
+    # Returns the concentrations of resource r over the grid, in patch order.
+    def field(self, r):
+        i = RIDX[r]
+        return [eco.env.res[i] for eco in self.patches]
+
+    # Returns the total number of cells in each patch, in patch order.
+    def counts(self):
+        counts = [sum([org.count for org in eco.orgs]) for eco in self.patches]
+        if self.blocks:
+            for worker, conn, indices in self.blocks:
+                conn.send(('counts', None))
+            for worker, conn, indices in self.blocks:
+                for p, count in zip(indices, conn.recv()):
+                    counts[p] = count
+        return counts
+
+    # Runs one minute: every patch with organisms cycles, then resources
+    # diffuse between neighbouring patches.  Patches don't affect each other
+    # within a minute, so with several processes each cycles a block of them.
+    def cycle(self):
+        if self.processes > 1:
+            if self.blocks == None:
+                self.start()
+            for worker, conn, indices in self.blocks:
+                conn.send(('cycle', array('d', [c for p in indices for c in self.patches[p].env.res]).tostring()))
+            for worker, conn, indices in self.blocks:
+                res = array('d')
+                res.fromstring(conn.recv())
+                for k, p in enumerate(indices):
+                    self.patches[p].env.res = res[k * NENV:(k + 1) * NENV].tolist()
+        else:
+            for eco in self.patches:
+                if eco.orgs:
+                    eco.cycle()
+        self.diffuse()
+
+    # Starts the workers, splitting the patches with organisms between them.
+    def start(self):
+        occupied = [p for p in range(self.size) if self.patches[p].orgs]
+        n = min(self.processes, len(occupied))
+        self.blocks = []
+        for b in range(n):
+            indices = occupied[b * len(occupied) // n:(b + 1) * len(occupied) // n]
+            conn, child = Pipe()
+            worker = Process(target=runBlock, args=(child, [self.patches[p] for p in indices]))
+            worker.daemon = True
+            worker.start()
+            child.close()
+            self.blocks.append((worker, conn, indices))
+
+    # Stops the workers, taking back the populations they ran.  The next
+    # cycle starts them again.
+    def stop(self):
+        if self.blocks == None:
+            return
+        for worker, conn, indices in self.blocks:
+            conn.send(('stop', None))
+        for worker, conn, indices in self.blocks:
+            for p, eco in zip(indices, conn.recv()):
+                # The environments here are the current ones.
+                eco.env = self.patches[p].env
+                self.patches[p] = eco
+            worker.join()
+        self.blocks = None
+
+    # One explicit diffusion step over the whole grid.  The environments'
+    # vectors are transposed into one field per resource; for each axis the
+    # differences between every patch and its next neighbour are taken with
+    # whole-list operations, weighted, then added to one side and subtracted
+    # from the other.  Fields that are already uniform are left alone.
+    def diffuse(self):
+        envs = [eco.env for eco in self.patches]
+        fields = zip(*[env.res for env in envs])
+        changed = False
+        for i in range(NENV):
+            c = fields[i]
+            if not self.rates[RESOURCES[i]] or max(c) == min(c):
+                continue
+            c = list(c)
+            new = list(c)
+            for s, weight in self.weights[i]:
+                flux = map(mul, map(sub, c[s:], c[:-s]), weight)
+                new[:-s] = map(add, new[:-s], flux)
+                new[s:] = map(sub, new[s:], flux)
+            fields[i] = new
+            changed = True
+        if changed:
+            for env, res in zip(envs, zip(*fields)):
+                env.res = list(res)
@@ -0,0 +1,102 @@
+import json
+import random
+import threading
+import time
+import urllib2
+from argparse import ArgumentParser
+from timeit import default_timer
+from defaults import displayedGenes
+
+# Stands in for a classroom of students using defs.service, to measure how
+# it copes under load.  With the service running, from the game folder:
+#   python -m defs.loadtest --url http://127.0.0.1:8080 --clients 30 --jobs 5
+#
+# Each client submits its jobs one after another, each a random genome, and
+# reads the streamed progress to the end.  Refused jobs (503) are retried
+# after the Retry-After delay.  At the end the throughput and latencies are
+# printed, along with the server's own /stats.
+
+
+# Submits one job and reads its reply.  Returns (seconds until the first
+# line, seconds until the result, number of 503s before it was accepted,
+# whether it succeeded).
+def runJob(url, body):
+    retries = 0
+    start = default_timer()
+    while True:
+        try:
+            reply = urllib2.urlopen(urllib2.Request(url + '/simulate', json.dumps(body),
+                                                    {'Content-Type': 'application/json'}))
+            break
+        except urllib2.HTTPError as e:
+            if e.code != 503:
+                return None, default_timer() - start, retries, False
+            retries += 1
+            time.sleep(float(e.headers.get('Retry-After', 1)) * random.uniform(0.5, 1.5))
+    first = None
+    ok = False
+    for line in iter(reply.readline, ''):
+        if first == None:
+            first = default_timer() - start
+        message = json.loads(line)
+        if 'result' in message:
+            ok = True
+    reply.close()
+    return first, default_timer() - start, retries, ok
+
+
+class Client(threading.Thread):
+    """One simulated student, submitting jobs one after another"""
+
+    def __init__(self, url, jobs, minutes, size, rng):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.url = url
+        self.bodies = []
+        catalog = [op.name for op in displayedGenes]
+        for i in range(jobs):
+            genes = [rng.choice(catalog) for j in range(rng.randint(0, size))]
+            self.bodies.append({'genes': genes, 'minutes': minutes})
+        self.results = []
+
+    def run(self):
+        for body in self.bodies:
+            self.results.append(runJob(self.url, body))
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Load test a running simulation service.')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--clients', type=int, default=30, help='concurrent clients')
+    parser.add_argument('--jobs', type=int, default=5, help='jobs per client')
+    parser.add_argument('--minutes', type=int, default=180, help='minutes per job')
+    parser.add_argument('--size', type=int, default=6, help='most operons per genome')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    clients = [Client(args.url, args.jobs, args.minutes, args.size, rng) for i in range(args.clients)]
+    start = default_timer()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = default_timer() - start
+
+    results = [r for c in clients for r in c.results]
+    ok = [r for r in results if r[3]]
+    latencies = sorted([r[1] for r in ok])
+    firsts = sorted([r[0] for r in ok if r[0] != None])
+    print "Jobs: %d succeeded, %d failed, %d refused with 503 before being accepted" % \
+          (len(ok), len(results) - len(ok), sum([r[2] for r in results]))
+    print "Throughput: %.1f jobs/sec over %.1f s" % (len(ok) / elapsed, elapsed)
+    if latencies:
+        print "Latency: mean %.3f s, median %.3f s, 95th percentile %.3f s" % \
+              (sum(latencies) / len(latencies), latencies[len(latencies) / 2],
+               latencies[int(len(latencies) * 0.95)])
+    if firsts:
+        print "First progress: median %.3f s" % firsts[len(firsts) / 2]
+    print "Server: " + json.dumps(json.load(urllib2.urlopen(args.url + '/stats')), sort_keys=True)
+
+if __name__ == '__main__':
+    main()
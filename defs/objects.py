@@ -1,15 +1,31 @@
+import copy
+import math
 import random
-from constants import DIFFUSES, OPTYPES
+from array import array
+from constants import DIFFUSES, OPTYPES, RESOURCES, RIDX, NENV, BOUNDS
+from constants import DYING_LOW, LIMITED_LOW, GROWING, LIMITED_HIGH, DYING_HIGH
 
 class Reaction:
     """Defines a reaction of reactants to products"""
 
-    def __init__(self, reactants, products):
+    # compiled may give (reacIdx, reacMol, prodIdx, prodMol) as worked out
+    # before, e.g. by a compiled catalog, so they aren't worked out again.
+    def __init__(self, reactants, products, compiled=None):
         # Each one must be a dictionary, with resource strings as keys and
         # the corresponding number of moles as the value.
         self.reactants = reactants
         self.products = products
 
+        # Compile the reaction against the resource vectors: the index and the
+        # moles per reaction of every reactant and product.
+        if compiled:
+            self.reacIdx, self.reacMol, self.prodIdx, self.prodMol = [list(c) for c in compiled]
+        else:
+            self.reacIdx = [RIDX[r] for r in reactants]
+            self.reacMol = [reactants[r] for r in reactants]
+            self.prodIdx = [RIDX[p] for p in products]
+            self.prodMol = [products[p] for p in products]
+
     def __str__(self):
         rxn = ""
         for r in self.reactants:
@@ -37,8 +53,9 @@ class Reaction:
     # the reaction.  Moles consumed get negative values.
     def getMoles(self, speciesL):
         concD = {}
+        species = self.species()
         # Find the limiting reactant/product of the ones provided.
-        rxnMoles = min([float(m)/self.species()[s] for s, m in speciesL])
+        rxnMoles = min([float(m)/species[s] for s, m in speciesL])
         # Then for each species, multiply the number of rxnMoles by the moles
         # produced per reaction and store it in the dictionary.
         for s in self.reactants:
@@ -57,7 +74,8 @@ class Operon:
     # is different.
     # For 'pas' or 'act', effect must be a resource string.
     # For 'rxn', effect must be a Reaction object.
-    # For 'mod', effect must be a tuple of (resourceStr, min/maxStr, offset).
+    # For 'mod', effect must be a tuple of (resourceStr, boundStr, offset),
+    # where boundStr is one of BOUNDS.
     # For 'misc', effect must be a special string.
     def __init__(self, name, size, function, effect, energyRequired=0, rate=None):
         self.name = name
@@ -67,6 +85,20 @@ class Operon:
         else:
             self.func = function
         self.eff = effect
+        # Transporters also keep the position of their resource in the
+        # resource vectors.
+        if function in ('pas', 'act'):
+            self.ridx = RIDX[effect]
+        else:
+            self.ridx = None
+        # Modifiers likewise keep (resource index, bound index, offset).
+        if function == 'mod':
+            r, bound, offset = effect
+            if bound not in BOUNDS:
+                raise ValueError("A modifier's bound must be one of " + ', '.join(BOUNDS) + ".")
+            self.mod = (RIDX[r], BOUNDS.index(bound), offset)
+        else:
+            self.mod = None
         self.rate = rate
         self.atpReq = energyRequired
         self.on = True
@@ -93,6 +125,7 @@ class Genome:
         # operons should be a list.  Initializing a genome then compiles info
         # about operons to save calculations down the road.
         self.size = 0
+        self.operons = list(operons)
         self.funcs = {'pas': [], 'act': [], 'rxn': [], 'mod': [], 'misc': []}
         for op in operons:
             self.funcs[op.func].append(op)
@@ -104,6 +137,60 @@ class Genome:
                 dnaPols += 1
         self.dnaPols = dnaPols
 
+        # Lower the reactions into one row per rxn operon, in the order they
+        # were added: (reactant indices, reactant moles, product indices,
+        # product moles, every species index, a bitmask of the species).
+        self.rxns = []
+        for op in self.funcs['rxn']:
+            rxn = op.eff
+            species = rxn.reacIdx + rxn.prodIdx
+            self.rxns.append((rxn.reacIdx, rxn.reacMol, rxn.prodIdx, rxn.prodMol,
+                              species, sum([1 << i for i in set(species)])))
+
+        # Index the passive channels by resource so organisms can check and
+        # toggle them without scanning every operon.  channels maps a resource
+        # index to its operons, channelIdx lists those indices in the order
+        # they were added, and isOpen holds whether each resource's channels
+        # are open.  Transporters are also kept in the order exchangeRes uses.
+        self.channels = {}
+        self.channelIdx = []
+        for op in self.funcs['pas']:
+            if op.ridx not in self.channels:
+                self.channels[op.ridx] = []
+                self.channelIdx.append(op.ridx)
+            self.channels[op.ridx].append(op)
+        self.isOpen = [i in self.channels for i in range(len(RESOURCES))]
+        self.canClose = [RESOURCES[i] not in DIFFUSES for i in range(len(RESOURCES))]
+        self.transport = self.funcs['pas'] + self.funcs['act']
+        # The resources exchangeRes can change: those transported, and ATP
+        # with its products.
+        self.exchanged = sorted(set([op.ridx for op in self.transport] +
+                                    [RIDX['ATP'], RIDX['ADP'], RIDX['P']]))
+
+        # Tolerance changes made by mod operons, as (resource index, bound
+        # index, offset), in the order they were added.
+        self.mods = [op.mod for op in self.funcs['mod']]
+
+    # Returns a genome with the same operons but its own channel state, for
+    # another population to open and close channels independently.
+    def copy(self):
+        genome = copy.copy(self)
+        genome.isOpen = list(self.isOpen)
+        return genome
+
+    # Opens the channels for the resource at index i, if there are any.
+    def open(self, i):
+        if not self.isOpen[i] and i in self.channels:
+            self.isOpen[i] = True
+            for op in self.channels[i]:
+                op.turnOn()
+
+    # Closes the channels for the resource at index i, unless it diffuses freely.
+    def close(self, i):
+        if self.isOpen[i] and self.canClose[i]:
+            self.isOpen[i] = False
+            for op in self.channels[i]:
+                op.turnOff()
 
     def printOps(self):
         for func in self.funcs:
@@ -111,15 +198,168 @@ class Genome:
                 print op
 
 
+# The growth factor of a population with n lethal resources is
+# DEATH_FACTORS[n]: a tenth of the cells die for each.
+DEATH_FACTORS = [0.0]
+for n in range(len(RESOURCES)):
+    DEATH_FACTORS.append(DEATH_FACTORS[-1] - 0.1)
+
+# The bit for each resource in the limits and dying masks.
+BITS = [1 << i for i in range(len(RESOURCES))]
+
+# Returns the indices of the bits set in mask, lowest first.
+def maskIndices(mask):
+    indices = []
+    i = 0
+    while mask:
+        if mask & 1:
+            indices.append(i)
+        mask >>= 1
+        i += 1
+    return indices
+
+# Names of the resources in each limits mask seen, joined as limitedBy()
+# returns them.
+LIMIT_NAMES = {0: None}
+
+def limitNames(mask):
+    if mask not in LIMIT_NAMES:
+        LIMIT_NAMES[mask] = ', '.join([RESOURCES[i] for i in maskIndices(mask)])
+    return LIMIT_NAMES[mask]
+
+# Draws from the Poisson distribution with the given mean, using rng.  Large
+# means use the normal approximation.
+def poisson(rng, mean):
+    if mean > 30:
+        return max(0.0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit = math.exp(-mean)
+    k = 0
+    p = rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return float(k)
+
+# Draws the number of successes in n trials with probability p, using rng.
+# Many trials use the normal approximation.
+def binomial(rng, n, p):
+    if n > 50:
+        return min(float(n), max(0.0, round(rng.gauss(n * p, math.sqrt(n * p * (1 - p))))))
+    return float(len([1 for i in range(n) if rng.random() < p]))
+
+# Tolerance tables are interned: tolerances() returns the one table for a set
+# of values, so organisms with the same tolerances share it instead of each
+# holding copies.
+TOLERANCES = {}
+
+# Returns the Tolerances table for a dictionary like CELLR, or for the
+# starting concentrations and the tuple of one vector per BOUNDS.
+def tolerances(resources, bounds=None):
+    if bounds == None:
+        current = tuple([float(resources[r]['current']) for r in RESOURCES])
+        bounds = tuple([tuple([float(resources[r][b]) for r in RESOURCES]) for b in BOUNDS])
+    else:
+        current = resources
+    key = (current, bounds)
+    if key not in TOLERANCES:
+        TOLERANCES[key] = Tolerances(current, bounds)
+    return TOLERANCES[key]
+
+
+class Tolerances:
+    """A shared, read-only table of starting concentrations and tolerance bounds"""
+
+    # Make tables with tolerances().  Every vector is a tuple indexed by RIDX
+    # and must never change; modified() returns a new table instead.
+    def __init__(self, current, bounds):
+        self.current = current
+        self.bounds = bounds
+        self.minLive, self.minGrow, self.ideal, self.maxGrow, self.maxLive = bounds
+        self.variants = {}
+
+    # Returns the table with mods applied, where mods is a list of (resource
+    # index, bound index, offset) like Genome.mods.  Variants are remembered,
+    # so every organism with the same genome shares one.
+    def modified(self, mods):
+        if not mods:
+            return self
+        key = tuple(mods)
+        if key not in self.variants:
+            bounds = [list(b) for b in self.bounds]
+            for i, b, offset in mods:
+                bounds[b][i] += offset
+            self.variants[key] = tolerances(self.current, tuple([tuple(b) for b in bounds]))
+        return self.variants[key]
+
+
 class Organism:
     """Represents organism populations"""
 
-    def __init__(self, name, genome, resources, count=100, cVol=6.5*10**-16):
+    # resources is a dictionary like CELLR, or a Tolerances table, which is
+    # quicker when making many organisms.  res holds the current
+    # concentrations as a vector indexed by RIDX, and is the only part of the
+    # table each organism copies; the tolerance bounds stay shared, with the
+    # genome's mod operons applied (see setTolerances).  modsApplied says
+    # resources already has them, as in a table read back from a checkpoint.
+    #
+    # status holds a code for each resource saying where it sits against
+    # the bounds, from DYING_LOW to DYING_HIGH.  limits has bit i set while
+    # resource i is outside its growth range, and dying while it is outside
+    # its living range.  Whatever changes res must call updateStatus().
+    def __init__(self, name, genome, resources, count=100, cVol=6.5*10**-16, modsApplied=False):
         self.name = name
         self.count = count
         self.cVol = cVol
         self.genes = genome
-        self.res = resources
+        self.rng = None     # Set to a random.Random to make division stochastic
+        if not isinstance(resources, Tolerances):
+            resources = tolerances(resources)
+        self.res = list(resources.current)
+        if not modsApplied:
+            resources = resources.modified(genome.mods)
+        self.setTolerances(resources)
+
+    # Points the organism at a tolerance table, keeping a reference to each
+    # bound's vector for the simulation's inner loops.
+    def setTolerances(self, tol):
+        self.tol = tol
+        self.minLive, self.minGrow, self.ideal, self.maxGrow, self.maxLive = tol.bounds
+        self.status = [GROWING] * len(RESOURCES)
+        self.limits = 0
+        self.dying = 0
+        self.updateStatus()
+
+    # Brings status, limits and dying up to date for the resources at the
+    # given indices, or for every resource.
+    def updateStatus(self, indices=None):
+        if indices == None:
+            indices = range(len(self.res))
+        res, status = self.res, self.status
+        minLive, minGrow, maxGrow, maxLive = self.minLive, self.minGrow, self.maxGrow, self.maxLive
+        limits, dying = self.limits, self.dying
+        for i in indices:
+            c = res[i]
+            # Most resources are in range, so check for that first.
+            if minGrow[i] <= c <= maxGrow[i] and minLive[i] <= c <= maxLive[i]:
+                if status[i] != GROWING:
+                    status[i] = GROWING
+                    limits &= ~BITS[i]
+                    dying &= ~BITS[i]
+                continue
+            bit = BITS[i]
+            if minGrow[i] <= c <= maxGrow[i]:
+                limits &= ~bit
+                code = GROWING
+            else:
+                limits |= bit
+                code = LIMITED_LOW if c < minGrow[i] else LIMITED_HIGH
+            if minLive[i] <= c <= maxLive[i]:
+                dying &= ~bit
+            else:
+                dying |= bit
+                code = DYING_LOW if c < minLive[i] else DYING_HIGH
+            status[i] = code
+        self.limits, self.dying = limits, dying
 
     def __str__(self):
         return self.name
@@ -128,37 +368,29 @@ class Organism:
         return self.name
 
     def printRes(self):
-        for key in self.res:
-            print key + ":\t" + str(self.res[key]['current'])
+        for i, r in enumerate(RESOURCES):
+            print r + ":\t" + str(self.res[i])
 
     def printChannels(self):
         print "Res\tOpen?\t[Res]"
-        for op in self.genes.funcs['pas']:
-            print op.eff + "\t" + str(op.on) + "\t" + str(self.res[op.eff]['current'])
+        for i in self.genes.channelIdx:
+            print RESOURCES[i] + "\t" + str(self.genes.isOpen[i]) + "\t" + str(self.res[i])
 
     def printSummary(self):
         print self.name + ": " + str(self.count)
         limitedBy = ""
         dyingFrom = ""
-        for r in self.res:
-            if not self.canGrow(r):
-                limitedBy = limitedBy + str(r) + ": " + str(self.res[r]['current']) + "  "
-                if not self.canLive(r):
-                    dyingFrom = dyingFrom + str(r) + " "
+        for i in maskIndices(self.limits):
+            limitedBy = limitedBy + RESOURCES[i] + ": " + str(self.res[i]) + "  "
+            if self.dying >> i & 1:
+                dyingFrom = dyingFrom + RESOURCES[i] + " "
         print "Limited by: " + limitedBy
-        print "Dying from: " + dyingFrom 
+        print "Dying from: " + dyingFrom
         print ""
 
+    # Returns the names of the resources limiting growth, or None.
     def limitedBy(self):
-        limitedBy = []
-        for r in self.res:
-            if not self.canGrow(r):
-                limitedBy.append(str(r))
-        if limitedBy:
-            lStr = ', '.join(limitedBy)
-            return lStr
-        else:
-            return None
+        return limitNames(self.limits)
 
     # Returns the current total volume of the population.
     def vol(self):
@@ -166,7 +398,8 @@ class Organism:
 
     # Returns the current number of moles of ATP available, as this is often needed.
     def atp(self):
-        moles = (self.res['ATP']['current'] - self.res['ATP']['minGrow']) * self.vol()
+        i = RIDX['ATP']
+        moles = (self.res[i] - self.minGrow[i]) * self.vol()
         if moles < 0:
             return 0.0
         else:
@@ -174,197 +407,221 @@ class Organism:
 
     # Adds the given number of moles (+ or -) to the current pool of resource r.
     def addRes(self, r, moles):
-        newConc = (self.res[r]['current'] * self.vol() + moles) / self.vol()
+        self.addResAt(RIDX[r], moles)
+
+    # Same as addRes, but takes the resource's index in the resource vectors.
+    def addResAt(self, i, moles):
+        vol = self.vol()
+        newConc = (self.res[i] * vol + moles) / vol
         if newConc < 0.0:
-            self.res[r]['current'] = 0.0
+            self.res[i] = 0.0
         else:
-            self.res[r]['current'] = newConc
+            self.res[i] = newConc
+        self.updateStatus((i,))
 
     # Hydrolyzes the given moles of ATP, converting it to ADP.
     def useATP(self, moles):
-        self.addRes('ATP', -moles)
-        self.addRes('ADP', moles)
-        self.addRes('P', moles)
+        self.addResAt(RIDX['ATP'], -moles)
+        self.addResAt(RIDX['ADP'], moles)
+        self.addResAt(RIDX['P'], moles)
 
     # Takes a resource string (like 'H+') and returns True if it can currently
     # undergo passive transport into or out of the organism.
     def canPass(self, r):
-        for op in self.genes.funcs['pas']:
-            # Only return True if it can tranport r and is on.
-            if op.eff == r and op.on:
-                return True
-
-        # Return False if all operons are checked and none fit the bill.
-        return False
+        return self.genes.isOpen[RIDX[r]]
 
     # Takes a resource string and closes all passive channels for the resource.
     def close(self, r):
-        for op in self.genes.funcs['pas']:
-            if op.eff == r:
-                op.turnOff()
+        self.genes.close(RIDX[r])
 
     # Opens all passive channels for the resource.
     def open(self, r):
-        for op in self.genes.funcs['pas']:
-            if op.eff == r:
-                op.turnOn()
+        self.genes.open(RIDX[r])
 
     # Returns True if that resource concentration is not lethal to the organism.
     # If no concentration is given, it checks the current concentration of r.
     def canLive(self, r, conc=None):
+        i = RIDX[r]
         if conc == None:
-            conc = self.res[r]['current']
-        return self.res[r]['minLive'] <= conc <= self.res[r]['maxLive']
+            return not self.dying >> i & 1
+        return self.minLive[i] <= conc <= self.maxLive[i]
 
     # Returns True if the resource concentration does not limit growth.
     # If no concentration is given, it checks the current concentration of r.
     def canGrow(self, r, conc=None):
+        i = RIDX[r]
         if conc == None:
-            conc = self.res[r]['current']
-        return self.res[r]['minGrow'] <= conc <= self.res[r]['maxGrow']
+            return not self.limits >> i & 1
+        return self.minGrow[i] <= conc <= self.maxGrow[i]
 
     # Finds the number of moles required (positive or negative) to reach the
     # the ideal concentration for the resource r.
     def molsReq(self, r):
-        cur = self.res[r]['current']
-        ideal = self.res[r]['ideal']
-        return (ideal - cur) * self.vol()
+        i = RIDX[r]
+        return (self.ideal[i] - self.res[i]) * self.vol()
 
-    # Takes an environmental resource dictionary and closes/opens passive
+    # Takes an environmental resource vector and closes/opens passive
     # channels according to concentrations and cellular needs.
     def setChannels(self, envRes):
-        for op in self.genes.funcs['pas']:
-            r = op.eff                       # Shorthand for the resource.
-            current = self.res[r]['current'] # Shorthand for the current internal conc of r.
-
+        minLive, maxLive = self.minLive, self.maxLive
+        minGrow, maxGrow = self.minGrow, self.maxGrow
+        limits, dying = self.limits, self.dying
+        genes = self.genes
+        for i in genes.channelIdx:
             # Check if the cell is dying due to the resource.
-            if not self.canLive(r, current):
+            if dying >> i & 1:
                 # Open the channel if the environment is better, otherwise close it.
-                if self.canLive(r, envRes[r]):
-                    self.open(r)
+                if minLive[i] <= envRes[i] <= maxLive[i]:
+                    genes.open(i)
                 else:
-                    self.close(r)
+                    genes.close(i)
 
             # Also check if the cell isn't growing.
-            elif not self.canGrow(r, current):
+            elif limits >> i & 1:
                 # Again, open if the environment is better.
-                if self.canGrow(r, envRes[r]):
-                    self.open(r)
+                if minGrow[i] <= envRes[i] <= maxGrow[i]:
+                    genes.open(i)
                 else:
-                    self.close(r)
+                    genes.close(i)
 
             # If intracellular levels are ideal, then close the channels.
             else:
-                self.close(r)
+                genes.close(i)
 
-    # Returns a dictionary of the resources available for pooling (i.e. with
-    # open passive channels), with the value being a tuple of the moles and volume.
+    # Returns the resources available for pooling (i.e. with open passive
+    # channels) as two environmental resource vectors: the moles of each
+    # resource and the volume they are in.  Both are zero for closed channels.
     def resAvailable(self):
-        resToPool = dict(zip([r for r in self.res], [(0,0) for r in self.res]))
-        for op in self.genes.funcs['pas']:
-            if op.on:
-                resToPool[op.eff] = (self.res[op.eff]['current'] * self.vol(), self.vol())
-        return resToPool
+        moles = [0.0] * NENV
+        vols = [0.0] * NENV
+        vol = self.vol()
+        isOpen = self.genes.isOpen
+        for i in self.genes.channelIdx:
+            if isOpen[i]:
+                moles[i] = self.res[i] * vol
+                vols[i] = vol
+        return moles, vols
 
     # Updates the organism's internal resources to the new environment,
     # according to which channels are open.
     def diffuseRes(self, envRes):
-        for res in envRes:
-            if self.canPass(res):
-                self.res[res]['current'] = envRes[res]
+        isOpen = self.genes.isOpen
+        for i in self.genes.channelIdx:
+            if isOpen[i]:
+                self.res[i] = envRes[i]
+        self.updateStatus(self.genes.channelIdx)
 
     # Checks all active transport operons, and if they should be used.
     # Also checks passive transport operons, because they should be able
     # to open momentarily, then shut before equilibrating.
     # Order matters here!  Most important active transport should go first.
     # Otherwise ATP might be used up obtaining non-vital resources.
+    # Closed channels are visited too, as they may open momentarily.
+    # envRes is a vector of the moles this organism may take, like one entry
+    # of Environment.partition().  Afterwards atpLimited holds the number of
+    # transports that were cut short by a lack of ATP.
     def exchangeRes(self, envRes, envVol):
-        for op in self.genes.funcs['pas'] + self.genes.funcs['act']:
-            r = op.eff
+        res = self.res
+        ideal = self.ideal
+        atpIdx, adpIdx, pIdx = RIDX['ATP'], RIDX['ADP'], RIDX['P']
+        atpMin = self.minGrow[atpIdx]
+        vol = self.vol()
+        atpLimited = 0
+        for op in self.genes.transport:
+            i = op.ridx
             # Only bother moving resources if we are outside growing range.
             #if not self.canGrow(r):
                 # First determine the moles that we need to reach ideal.
-            moles = self.molsReq(r)
+            moles = (ideal[i] - res[i]) * vol
 
             # If num of moles is positive and greater than the environment,
             # then we are limited by external availability.
-            if moles > 0 and moles > envRes[r]:
-                moles = envRes[r]
+            if moles > 0 and moles > envRes[i]:
+                moles = envRes[i]
 
             # Now determine the ATP to be used and if it is limiting.
             atp = abs(moles * op.atpReq)
 
             # If we don't have enough ATP, then use only as much as we can.
-            if atp > self.atp():
-                atp = self.atp()
+            available = (res[atpIdx] - atpMin) * vol
+            if available < 0:
+                available = 0.0
+            if atp > available:
+                atp = available
                 # Keep the sign of moles, but can only export as much as ATP allows.
                 moles = cmp(moles, 0) * atp / op.atpReq
+                atpLimited += 1
 
             # If the operon is passive, it is limited by the concentration gradient.
             if op.func == 'pas':
-                eqConc = (self.res[r]['current'] * self.vol() + envRes[r] * envVol) / (self.vol() + envVol)
+                eqConc = (res[i] * vol + envRes[i] * envVol) / (vol + envVol)
                 # The cells can only gain or lose as many moles as it takes to reach equilibrium.
-                eqMoles = (eqConc - self.res[r]['current']) * self.vol()
+                eqMoles = (eqConc - res[i]) * vol
                 if eqMoles >= 0 and moles > eqMoles:
                     moles = eqMoles
                 elif eqMoles < 0 and moles < eqMoles:
                     moles = eqMoles
 
-            # Then add/substract the resources and use the ATP.
-            #print "Taking " + str(moles) + " moles of " + r
-            self.addRes(r, moles)
-            self.useATP(atp)
-            envRes[r] = envRes[r] - moles
+            # Then add/substract the resources and use the ATP, converting it
+            # to ADP and P.  This is addResAt() and useATP(), inlined.
+            #print "Taking " + str(moles) + " moles of " + op.eff
+            for j, m in ((i, moles), (atpIdx, -atp), (adpIdx, atp), (pIdx, atp)):
+                newConc = (res[j] * vol + m) / vol
+                res[j] = 0.0 if newConc < 0.0 else newConc
+            envRes[i] = envRes[i] - moles
+        self.atpLimited = atpLimited
+        self.updateStatus(self.genes.exchanged)
         return envRes
 
     # Converts things to place concentrations in the growth range.
     # Goes through the rxn operons in the order they were added, so
     # earlier operons may use up some resources, leaving none for later ones.
+    # Returns the number of reactions that ran.
     def convertRes(self):
+        res = self.res
+        minGrow, maxGrow, ideal = self.minGrow, self.maxGrow, self.ideal
+        vol = self.vol()
+        fired = 0
         # For every reaction, check if it should run and if so, for what values.
-        for op in self.genes.funcs['rxn']:
-            # Reactants remove a resource, products create a resource
-            reac = op.eff.reactants.keys()
-            prod = op.eff.products.keys()
-            desired = []
-
+        for reacIdx, reacMol, prodIdx, prodMol, species, mask in self.genes.rxns:
             # Check to see if we need to do the reaction.  Only do it if
             # any of the involved species are outside growing range.
-            needRxn = False
-            for s in reac + prod:
-                if not self.canGrow(s):
-                    needRxn = True
-
-            if needRxn:
-                # Check if we need any more of the products or less of the reactants.
-                for r in prod:
-                    need = self.molsReq(r)
-                    if need > 0:
-                        desired.append((r, need))
-                    # If we don't need more product, then make sure we don't make too much.
-                    else:
-                        canTake = (self.res[r]['maxGrow'] - self.res[r]['current']) * self.vol()
-                        desired.append((r, canTake))
-                for r in reac:
-                    need = self.molsReq(r)
-                    if need < 0:
-                        desired.append((r, abs(need)))
-                    # If the current concentration is already below ideal, then we
-                    # only allocate as much as we can.
-                    else:
-                        canSpare = (self.res[r]['current'] - self.res[r]['minGrow']) * self.vol()
-                        if canSpare <= 0:
-                            canSpare = 0.0
-                        desired.append((r, canSpare))
-
-                # Perform the reaction given our desired constraints.
-                react = op.eff.getMoles(desired)
-                #print desired
-                #print react
-
-                # Update the resources used in the reaction.
-                for r in react:
-                    self.addRes(r, react[r])
+            if not self.limits & mask:
+                continue
+
+            fired += 1
+            # Find the limiting reactant/product, as moles of reaction.
+            # We want more of the products or less of the reactants.
+            rxnMoles = None
+            for i, n in zip(prodIdx, prodMol):
+                need = (ideal[i] - res[i]) * vol
+                # If we don't need more product, then make sure we don't make too much.
+                if need <= 0:
+                    need = (maxGrow[i] - res[i]) * vol
+                if rxnMoles is None or need / n < rxnMoles:
+                    rxnMoles = need / n
+            for i, n in zip(reacIdx, reacMol):
+                need = (ideal[i] - res[i]) * vol
+                if need < 0:
+                    spare = -need
+                # If the current concentration is already below ideal, then we
+                # only allocate as much as we can.
+                else:
+                    spare = (res[i] - minGrow[i]) * vol
+                    if spare <= 0:
+                        spare = 0.0
+                if rxnMoles is None or spare / n < rxnMoles:
+                    rxnMoles = spare / n
+
+            # Update the resources used in the reaction.
+            for i, n in zip(reacIdx, reacMol):
+                newConc = (res[i] * vol - n * rxnMoles) / vol
+                res[i] = 0.0 if newConc < 0.0 else newConc
+            for i, n in zip(prodIdx, prodMol):
+                newConc = (res[i] * vol + n * rxnMoles) / vol
+                res[i] = 0.0 if newConc < 0.0 else newConc
+            self.updateStatus(species)
+        return fired
 
     # Returns a factor by which the genome can increase in 1 minute.
     def calcGrowth(self):
@@ -378,51 +635,55 @@ class Organism:
 
     # Handles the division of the organisms.  Division rate is based upon the
     # genome size and (eventually) available resources.
-    # Returns a dictionary of resources released (all zero, unless cells died).
+    # Returns a vector of moles of resources released, or None if no cells died.
     def divide(self):
-        # First check if cells should multiply or die.
-        canGrow = True
-        canLive = True
-        factor = 0.0
-        for r in self.res:
-            if not self.canLive(r, self.res[r]['current']):
-                factor -= 0.1
-                canLive = False
-            if not self.canGrow(r, self.res[r]['current']):
-                canGrow = False
+        res = self.res
+        # First check if cells should multiply or die.  Each lethal resource
+        # kills another tenth of the cells.
+        canGrow = not self.limits
+        canLive = not self.dying
+        factor = DEATH_FACTORS[bin(self.dying).count('1')]
         if canGrow:
             factor = self.calcGrowth()
-            #print factor
             #molesBP = factor * self.genes.size * self.count * 6.022*10**-23
-            #print molesBP
-            #self.printRes()
-            #print ""
             #self.addRes('N', -molesBP * 4.0)
-            #self.printRes()
-            #print ""
             #self.addRes('P', -molesBP * 3.0)
 
-        # Adjust the count based on the growth factor.
+        # With an rng set, the number of cells born or killed is drawn around
+        # the expected number, and factor becomes the change that happened.
+        if self.rng and self.count > 0:
+            if factor > 0:
+                factor = poisson(self.rng, self.count * factor) / self.count
+            elif factor < 0:
+                factor = -binomial(self.rng, int(self.count), min(-factor, 1.0)) / self.count
+
+        # Adjust the count based on the growth factor.  Drawn counts are
+        # whole cells, so keep them from drifting off by rounding error.
         self.count = self.count * (1.0 + factor)
+        if self.rng:
+            self.count = float(round(self.count))
 
         # Distribute/release resources based on the growth factor.
-        resReleased = {}
-        for r in self.res:
-            if not canLive:
-                resReleased[r] = self.res[r]['current'] * abs(factor) * self.vol()
-            else:
-                resReleased[r] = 0.0
-            self.res[r]['current'] = self.res[r]['current'] / (1.0 + abs(factor))
+        if canLive:
+            resReleased = None
+        else:
+            vol = self.vol()
+            resReleased = [c * abs(factor) * vol for c in res]
+        dilution = 1.0 + abs(factor)
+        self.res = [c / dilution for c in res]
+        self.updateStatus()
         return resReleased
 
 
 class Environment:
     """Represents a microbiological environment"""
 
+    # res is a dictionary like ENVR.  Its values are copied into a flat
+    # vector indexed by RIDX.
     def __init__(self, name, vol, res):
         self.name = name
         self.vol = vol
-        self.res = res
+        self.res = [float(res[r]) for r in RESOURCES[:NENV]]
 
     def __str__(self):
         return self.name
@@ -431,13 +692,13 @@ class Environment:
         return self.name
 
     def printRes(self):
-        for key in self.res:
-            print key + ":\t\t" + str(self.res[key])
+        for i in range(NENV):
+            print RESOURCES[i] + ":\t\t" + str(self.res[i])
 
-    # Returns a list of dictionaries, one for each organism in the community.
-    # Each dictionary contains the moles of resources available to that organism
+    # Returns a list of resource vectors, one for each organism in the community.
+    # Each vector contains the moles of resources available to that organism
     # for the current step.  Organisms essentially "check out" a resource
-    # dictionary, actively add/remove resources, then return it to the environment.
+    # vector, actively add/remove resources, then return it to the environment.
     # community should be a list of organisms.
     def partition(self, community):
         # Find the proportion of each organism by volume
@@ -445,26 +706,92 @@ class Environment:
         total = sum(volumes)
         proportions = [x/total for x in volumes]
 
-        # Then build a dictionary for each organism, giving it resources
+        # Then build a vector for each organism, giving it resources
         # proportional to its fractional volume.
-        resources = []
-        for i in range(len(community)):
-            resources.append({})
-            for key in self.res:
-                resources[i][key] = (self.res[key] * self.vol * proportions[i])
-        return resources
+        moles = [c * self.vol for c in self.res]
+        return [[m * p for m in moles] for p in proportions]
 
     # Updates the environmental resources by summing the number of moles
     # each organism has left for the environment.
-    # resources should be a list of dictionaries, like that created by partition().
+    # partition should be a list of vectors, like that created by partition().
     def update(self, partition):
-        for r in self.res:
-            totalMoles = sum([o[r] for o in partition])
-            self.res[r] = totalMoles / self.vol
+        if partition:
+            self.res = [total / self.vol for total in map(sum, zip(*partition))]
 
     def addRes(self, r, moles):
-        if r in self.res:
-            self.res[r] = (self.res[r] * self.vol + moles) / self.vol
+        if r in RIDX and RIDX[r] < NENV:
+            self.addResAt(RIDX[r], moles)
+
+    # Same as addRes, but takes the resource's index in the resource vector.
+    def addResAt(self, i, moles):
+        self.res[i] = (self.res[i] * self.vol + moles) / self.vol
+
+
+class Tracker:
+    """Records a population's count every minute in constant memory"""
+
+    # The last `recent` counts are kept at full resolution in a ring buffer.
+    # Older counts are downsampled into an archive of at most `archive` points:
+    # whenever it fills up, every other point is dropped and the number of
+    # minutes between archived points doubles.  If sink is given, it is called
+    # with every count appended, for a full resolution export.
+    def __init__(self, recent=256, archive=1024, sink=None):
+        self.size = recent
+        self.ring = array('d', [0.0] * recent)
+        self.n = 0
+        self.archive = array('d')
+        self.archiveSize = archive
+        self.stride = 1
+        self.sink = sink
+
+    def __len__(self):
+        return self.n
+
+    # Counts can be looked up by minute, or from the end with negative
+    # indices, as long as they are still in the ring buffer.
+    def __getitem__(self, k):
+        if k < 0:
+            k += self.n
+        if not max(0, self.n - self.size) <= k < self.n:
+            raise IndexError("Count is no longer held at full resolution")
+        return self.ring[k % self.size]
+
+    def append(self, count):
+        pos = self.n % self.size
+        # Move the count being overwritten into the archive, if it is due.
+        if self.n >= self.size:
+            minute = self.n - self.size
+            if minute % self.stride == 0:
+                self.archive.append(self.ring[pos])
+                if len(self.archive) >= self.archiveSize:
+                    self.archive = self.archive[::2]
+                    self.stride *= 2
+        self.ring[pos] = count
+        self.n += 1
+        if self.sink:
+            self.sink(count)
+
+    # Returns True if the count hasn't changed over the last window minutes.
+    def stalled(self, window):
+        if window >= self.size:
+            raise ValueError("Window must be smaller than the ring buffer.")
+        n = self.n
+        return n > window and self.ring[(n - window) % self.size] == self.ring[(n - 1) % self.size]
+
+    # Returns a list of (minute, count) pairs: the archived counts followed
+    # by every count still in the ring buffer.
+    def history(self):
+        start = max(0, self.n - self.size)
+        points = [(m * self.stride, c) for m, c in enumerate(self.archive)
+                  if m * self.stride < start]
+        points.extend([(m, self[m]) for m in range(start, self.n)])
+        return points
+
+
+# Ecosystem.advance() fast-forwards once this many consecutive cycles were
+# pure exponential growth, matching to within STEADY_TOLERANCE.
+STEADY_CYCLES = 2
+STEADY_TOLERANCE = 10**-9
 
 
 class Ecosystem:
@@ -473,50 +800,233 @@ class Ecosystem:
     def __init__(self, orgs, env):
         self.orgs = orgs
         self.env = env
-        self.tracker = dict(zip(orgs, [[] for org in orgs]))  # To track populations
+        self.tracker = dict(zip(orgs, [Tracker() for org in orgs]))  # To track populations
+        self.probe = None   # Set to a probe.Probe to collect timings and counters
+        self.recorder = None    # Set to a record.Recorder to save trajectories
+
+        # With fastForward set, advance() skips over stretches of pure
+        # exponential growth.  steady counts the consecutive cycles seen
+        # that were pure growth.
+        self.fastForward = False
+        self.steady = 0
 
     def printPops(self):
         for org in self.orgs:
             print str(org) + ": " + str(org.count)
 
+    # Adds another organism population to the ecosystem.
+    def add(self, org):
+        self.orgs.append(org)
+        self.tracker[org] = Tracker()
+
+    # Takes a population out of the ecosystem, e.g. once it has died out.
+    # Its tracker is kept.
+    def remove(self, org):
+        self.orgs.remove(org)
+
+    # Mixes the resources the organisms made available for diffusion into the
+    # environment.  Takes the lists of mole and volume vectors from resAvailable(),
+    # i.e. population x resource matrices, and reduces them over the populations.
+    def poolRes(self, diffusedMoles, diffusedVols):
+        env = self.env
+        if not diffusedMoles:
+            return
+        moles = map(sum, zip(*diffusedMoles))
+        vols = map(sum, zip(*diffusedVols))
+        # New conc = (moles from cells + moles from env) / total volume
+        env.res = [(m + c * env.vol) / (v + env.vol)
+                   for m, v, c in zip(moles, vols, env.res)]
+
     def cycle(self):
+        env = self.env
+        probe = self.probe
+        if probe:
+            t = probe.start()
         # Set the amount of light.
-        light = self.env.res['Lux']
-        diffusedRes = []
+        light = env.res[RIDX['Lux']]
+        diffusedMoles = []
+        diffusedVols = []
 
         # Every organism will set channels, add its count to the tracker,
         # and tell the amount of resources available for diffusion.
         for org in self.orgs:
             self.tracker[org].append(org.count)
-            org.setChannels(self.env.res)
-            diffusedRes.append(org.resAvailable())
+            org.setChannels(env.res)
+            moles, vols = org.resAvailable()
+            diffusedMoles.append(moles)
+            diffusedVols.append(vols)
+        if probe:
+            for org in self.orgs:
+                probe.count('openChannels', sum([org.genes.isOpen[i] for i in org.genes.channelIdx]))
+            t = probe.phase('channels', t)
 
         # Then the new environmental concentration will be found.
-        for r in self.env.res:
-            # New conc = (moles from cells + moles from env) / total volume
-            self.env.res[r] = ((sum([o[r][0] for o in diffusedRes]) + 
-                               self.env.res[r] * self.env.vol)/
-                               (sum([o[r][1] for o in diffusedRes]) + self.env.vol))
+        self.poolRes(diffusedMoles, diffusedVols)
+        if probe:
+            t = probe.phase('pooling', t)
 
         # Then the resources will diffuse into/out of cells
         for org in self.orgs:
-            org.diffuseRes(self.env.res)
+            org.diffuseRes(env.res)
+        if probe:
+            t = probe.phase('diffusion', t)
 
         # After diffusion, the environmental resources will be partitioned
         # and each cell can actively transport its share.  Then the environment
         # must be updated.
-        partition = self.env.partition(self.orgs)
+        partition = env.partition(self.orgs)
         for i in range(len(self.orgs)):
-            partition[i] = self.orgs[i].exchangeRes(partition[i], self.env.vol)
-        self.env.update(partition)
+            partition[i] = self.orgs[i].exchangeRes(partition[i], env.vol)
+            if probe:
+                probe.count('atpLimited', self.orgs[i].atpLimited)
+        env.update(partition)
+        if probe:
+            t = probe.phase('exchange', t)
 
         # And finally each organism performs internal processes and grows/dies.
+        # Resources released by dying cells are returned to the environment
+        # all at once.
+        released = []
         for org in self.orgs:
-            org.convertRes()
+            fired = org.convertRes()
+            if probe:
+                probe.count('reactions', fired)
+                t = probe.phase('conversion', t)
             #org.printSummary()
             resReleased = org.divide()
-            for r, m in resReleased.items():
-                self.env.addRes(r, m)
-        
-        org.convertRes()
-        self.env.res['Lux'] = light # Light resets, or can change according to some function
+            if resReleased:
+                released.append(resReleased)
+            if probe:
+                t = probe.phase('division', t)
+        if released:
+            for i, moles in enumerate(map(sum, zip(*released))[:NENV]):
+                env.addResAt(i, moles)
+
+        env.res[RIDX['Lux']] = light # Light resets, or can change according to some function
+        if probe:
+            probe.phase('division', t)
+            probe.end()
+        if self.recorder:
+            self.recorder.record(self)
+
+    # Advances the ecosystem by at most the given number of minutes, and
+    # returns how many minutes passed.  Normally this runs a single cycle.
+    # With fastForward set, once STEADY_CYCLES consecutive cycles have been
+    # pure exponential growth, it instead jumps ahead to just before the
+    # first resource leaves its growth range.
+    def advance(self, minutes=1):
+        if not self.fastForward:
+            self.cycle()
+            return 1
+
+        if self.steady >= STEADY_CYCLES:
+            n = min(self.steadyMinutes(), minutes)
+            if n > 1:
+                n = self.skip(n)
+                if n:
+                    self.steady = 0
+                    return n
+
+        before = [(org.count, list(org.res)) for org in self.orgs]
+        envBefore = list(self.env.res)
+        self.cycle()
+        if self.isSteady(before, envBefore):
+            self.steady += 1
+        else:
+            self.steady = 0
+        return 1
+
+    # Returns the indices of the resources that only pool and diffuse
+    # between the cells and the environment: freely diffusing ones with an
+    # open channel that no organism actively transports.
+    def pooledIdx(self):
+        pooled = set()
+        active = set()
+        for org in self.orgs:
+            genes = org.genes
+            pooled.update([i for i in genes.channelIdx if genes.isOpen[i] and not genes.canClose[i]])
+            active.update([op.ridx for op in genes.funcs['act']])
+        return pooled - active
+
+    # Returns True if the last cycle did nothing but grow every organism:
+    # each count rose by its growth factor, the environment is unchanged, and
+    # every internal concentration was diluted by that factor.  Resources that
+    # only pool and diffuse are left out, as skip() follows them itself.
+    def isSteady(self, before, envBefore):
+        close = lambda a, b: abs(a - b) <= STEADY_TOLERANCE * max(abs(a), abs(b))
+        pooled = self.pooledIdx()
+        for i in range(NENV):
+            if i not in pooled and not close(self.env.res[i], envBefore[i]):
+                return False
+        for org, (count, res) in zip(self.orgs, before):
+            factor = 1.0 + org.calcGrowth()
+            if not org.genes.dnaPols or not close(org.count, count * factor):
+                return False
+            for i in range(len(res)):
+                if i not in pooled and not close(org.res[i] * factor, res[i]):
+                    return False
+        return True
+
+    # Predicts how many more minutes of pure growth every organism has: the
+    # number of cycles that start with all diluted resources still at or above
+    # their minGrow.  The last of those cycles is left to be simulated.
+    # Freely diffusing resources follow the environment, which the growing
+    # cells pull along as they pool with it, so skip() checks those itself.
+    def steadyMinutes(self):
+        pooled = self.pooledIdx()
+        minutes = None
+        for org in self.orgs:
+            factor = 1.0 + org.calcGrowth()
+            for i in range(len(org.res)):
+                if i in pooled:
+                    continue
+                if org.minGrow[i] > 0:
+                    if org.res[i] < org.minGrow[i]:
+                        return 0
+                    n = int(math.log(org.res[i] / org.minGrow[i]) / math.log(factor))
+                    # Guard against rounding in the logarithms.
+                    while n > 0 and org.res[i] / factor**n < org.minGrow[i]:
+                        n -= 1
+                    if minutes == None or n < minutes:
+                        minutes = n
+        if minutes == None:
+            return 0
+        return minutes
+
+    # Grows every organism for at most n minutes without running the whole
+    # cycles, filling in the tracker and recorder as if each minute had been
+    # simulated, and returns how many minutes passed.  Only valid during pure
+    # exponential growth.  Each minute still pools and diffuses the freely
+    # diffusing resources as cycle() does, since the cells' growing volume
+    # pulls the environment along, and stops before a minute that would take
+    # one of them out of its growth range.
+    def skip(self, n):
+        env = self.env
+        light = env.res[RIDX['Lux']]
+        growth = [(org, 1.0 + org.calcGrowth(), self.tracker[org]) for org in self.orgs]
+        for k in range(n):
+            envBefore = list(env.res)
+            before = [list(org.res) for org in self.orgs]
+            available = [org.resAvailable() for org in self.orgs]
+            self.poolRes([moles for moles, vols in available], [vols for moles, vols in available])
+            for org in self.orgs:
+                org.diffuseRes(env.res)
+            if [org for org in self.orgs if org.limits or org.dying]:
+                # Leave this minute to be simulated.
+                env.res = envBefore
+                for org, res in zip(self.orgs, before):
+                    org.res = res
+                    org.updateStatus(org.genes.channelIdx)
+                n = k
+                break
+            for org, factor, tracker in growth:
+                tracker.append(org.count)
+                org.count = org.count * factor
+                org.res = [c / factor for c in org.res]
+            env.res[RIDX['Lux']] = light
+            if self.recorder:
+                self.recorder.record(self)
+        for org in self.orgs:
+            org.updateStatus()
+        return n
+
@@ -0,0 +1,75 @@
+from collections import deque
+from timeit import default_timer
+
+# Phases of Ecosystem.cycle that a Probe times, in the order they run.
+PHASES = ['channels', 'pooling', 'diffusion', 'exchange', 'conversion', 'division']
+
+# Counters that Ecosystem.cycle reports to a Probe.
+COUNTERS = ['openChannels', 'reactions', 'atpLimited']
+
+
+class Probe:
+    """Collects per-phase timings and counters from Ecosystem.cycle"""
+
+    # Attach a probe with ecosystem.probe = Probe().  It keeps the samples of
+    # the last `window` cycles for rolling aggregates, plus totals since it
+    # was attached.  Timings are in seconds.
+    def __init__(self, window=100):
+        self.window = window
+        self.samples = deque()
+        self.sums = dict([(k, 0.0) for k in PHASES + COUNTERS])
+        self.totals = dict([(k, 0.0) for k in PHASES + COUNTERS])
+        self.cycles = 0
+        self.current = None
+
+    # Starts a new cycle's sample and returns the time.
+    def start(self):
+        self.current = dict([(k, 0.0) for k in PHASES + COUNTERS])
+        return default_timer()
+
+    # Adds the time since `since` to a phase and returns the time now, so
+    # consecutive phases can be chained.
+    def phase(self, name, since):
+        now = default_timer()
+        self.current[name] += now - since
+        return now
+
+    def count(self, name, n=1):
+        self.current[name] += n
+
+    # Finishes the cycle's sample and updates the aggregates.
+    def end(self):
+        sample = self.current
+        self.samples.append(sample)
+        for k in sample:
+            self.sums[k] += sample[k]
+            self.totals[k] += sample[k]
+        if len(self.samples) > self.window:
+            old = self.samples.popleft()
+            for k in old:
+                self.sums[k] -= old[k]
+        self.cycles += 1
+        self.current = None
+
+    # Returns the mean of a phase or counter over the last window cycles.
+    def mean(self, name):
+        if not self.samples:
+            return 0.0
+        return self.sums[name] / len(self.samples)
+
+    # Returns the largest value of a phase or counter over the last window cycles.
+    def max(self, name):
+        return max([0.0] + [s[name] for s in self.samples])
+
+    # Returns a dictionary of {name: (mean, max, total)} for every phase and counter.
+    def summary(self):
+        return dict([(k, (self.mean(k), self.max(k), self.totals[k])) for k in PHASES + COUNTERS])
+
+    def printSummary(self):
+        print "Over the last " + str(len(self.samples)) + " of " + str(self.cycles) + " cycles:"
+        print "Phase\t\tmean us\tmax us"
+        for k in PHASES:
+            print k.ljust(12) + "\t%.1f\t%.1f" % (self.mean(k) * 10**6, self.max(k) * 10**6)
+        print "Counter\t\tmean\tmax"
+        for k in COUNTERS:
+            print k.ljust(12) + "\t%.1f\t%d" % (self.mean(k), self.max(k))
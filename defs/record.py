@@ -0,0 +1,148 @@
+import csv
+import sys
+from array import array
+from constants import *
+
+# Records the trajectory of a run, minute by minute: every population's count
+# and internal resources, and the environment's resources.  Attach one with
+#   eco.recorder = Recorder('run.csv')
+#   ... cycle the ecosystem ...
+#   eco.recorder.close()
+#
+# Each recorded minute is one row.  Rows pass down a pipeline of generators:
+# buffered() collects them into chunks, and the writer for the file type
+# writes each chunk out, so memory use doesn't grow with the length of the
+# run.  Paths ending in .npy are written as a 2-D array of doubles, with the
+# column names in a text file beside it; anything else is written as CSV.
+
+# Rows collected before each write.
+CHUNK = 256
+
+
+# Starts a generator so rows can be sent to it.
+def started(gen):
+    next(gen)
+    return gen
+
+# Collects the rows sent to it into lists of up to size rows and sends those
+# on to sink.  Sending None flushes a partial chunk, and closing it closes sink.
+def buffered(sink, size=CHUNK):
+    chunk = []
+    try:
+        while True:
+            row = yield
+            if row != None:
+                chunk.append(row)
+            if chunk and (row == None or len(chunk) >= size):
+                sink.send(chunk)
+                chunk = []
+    finally:
+        sink.close()
+
+# Writes the chunks sent to it to a CSV file, with a header of columns.
+def csvWriter(path, columns):
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        while True:
+            chunk = yield
+            writer.writerows([[repr(v) for v in row] for row in chunk])
+            f.flush()
+
+# Writes the chunks sent to it to a .npy file of little-endian doubles, one
+# row per row sent, and the column names to path + '.columns'.  The header
+# holding the array's shape is rewritten after every chunk, so the file is
+# always a complete array.
+def npyWriter(path, columns):
+    with open(path + '.columns', 'w') as f:
+        f.write('\n'.join(columns) + '\n')
+    with open(path, 'wb') as f:
+        rows = 0
+        f.write(npyHeader(rows, len(columns)))
+        while True:
+            chunk = yield
+            data = array('d', [v for row in chunk for v in row])
+            if sys.byteorder == 'big':
+                data.byteswap()
+            f.write(data.tostring())
+            rows += len(chunk)
+            f.seek(0)
+            f.write(npyHeader(rows, len(columns)))
+            f.seek(0, 2)
+            f.flush()
+
+# Returns the header of a version 1.0 .npy file holding a rows x cols array
+# of doubles.  It is always padded to the same length, so it can be rewritten
+# in place as rows are added.
+def npyHeader(rows, cols):
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, cols)
+    header = header.ljust(128 - 10 - 1) + '\n'
+    return '\x93NUMPY\x01\x00' + chr(len(header) % 256) + chr(len(header) // 256) + header
+
+
+class Recorder:
+    """Streams an ecosystem's per-minute trajectory to a CSV or .npy file"""
+
+    # every records one minute in that many.  resources is a list of the
+    # resource names to record, defaulting to all of them; populations
+    # record every resource in it, and the environment the environmental
+    # ones.  The columns are fixed by the first minute recorded, so
+    # populations added later aren't recorded.
+    def __init__(self, path, every=1, resources=None):
+        if every < 1:
+            raise ValueError("every must be at least 1.")
+        if resources == None:
+            resources = RESOURCES
+        for r in resources:
+            if r not in RIDX:
+                raise ValueError("Unknown resource: " + r)
+        self.path = path
+        self.every = every
+        self.orgIdx = [RIDX[r] for r in resources]
+        self.envIdx = [i for i in self.orgIdx if i < NENV]
+        self.minute = 0
+        self.orgs = None
+        self.pipe = None
+
+    # Returns the names of the columns for an ecosystem's populations.
+    def columns(self, orgs):
+        columns = ['minute']
+        for org in orgs:
+            columns.append(org.name + ' count')
+            columns.extend([org.name + ' ' + RESOURCES[i] for i in self.orgIdx])
+        columns.extend(['Environment ' + RESOURCES[i] for i in self.envIdx])
+        return columns
+
+    # Called by the ecosystem at the end of every simulated minute.
+    def record(self, eco):
+        self.minute += 1
+        if self.minute % self.every:
+            return
+        if self.pipe == None:
+            self.orgs = list(eco.orgs)
+            if self.path.endswith('.npy'):
+                writer = npyWriter(self.path, self.columns(self.orgs))
+            else:
+                writer = csvWriter(self.path, self.columns(self.orgs))
+            self.pipe = started(buffered(started(writer)))
+        row = [self.minute]
+        orgIdx = self.orgIdx
+        for org in self.orgs:
+            res = org.res
+            row.append(org.count)
+            row.extend([res[i] for i in orgIdx])
+        res = eco.env.res
+        row.extend([res[i] for i in self.envIdx])
+        self.pipe.send(row)
+
+    # Writes out any buffered rows.
+    def flush(self):
+        if self.pipe:
+            self.pipe.send(None)
+
+    # Writes out any buffered rows and closes the file.
+    def close(self):
+        if self.pipe:
+            self.pipe.send(None)
+            self.pipe.close()
+            self.pipe = None
@@ -0,0 +1,123 @@
+from argparse import ArgumentParser
+from defaults import *
+from probe import Probe
+from record import Recorder
+
+# Runs the cellular simulation without the pygame front end, as fast as the
+# CPU allows.  Usage from the game folder:
+#   python -m defs.run --genes "Glucose Transporter,Aerobic Respiration" --minutes 180
+
+# The game stops once the population hasn't changed for STALL_WINDOW minutes,
+# or once TIME_LIMIT minutes have passed.
+STALL_WINDOW = 10
+TIME_LIMIT = 180
+
+# Builds the same ecosystem as clicking "Go!" in the game: the hidden genes
+# followed by the named operons, a fresh cell and the default environment.
+# envRes may be a dictionary of differences from ENVR.
+def buildEcosystem(geneNames, envRes=None):
+    for name in geneNames:
+        if name not in operons:
+            raise ValueError("Unknown operon: " + name)
+    genome = Genome(hiddenGenes + [operons[name] for name in geneNames])
+    org = Organism('Player Organism', genome, cellTolerances)
+    res = dict(ENVR)
+    if envRes:
+        res.update(envRes)
+    env = Environment('Game Environment', 1, res)
+    return Ecosystem([org], env)
+
+# Cycles the ecosystem until the first organism stalls or the time runs out.
+# Returns a dictionary summarizing the run.  With fastForward, stretches of
+# pure exponential growth are skipped over (see Ecosystem.advance).
+# progress, if given, is called with the time and the first organism's
+# count each time the ecosystem advances.
+def simulate(eco, minutes=TIME_LIMIT, fastForward=False, progress=None):
+    org = eco.orgs[0]
+    eco.fastForward = fastForward
+    time = 0
+    stalled = False
+    while time < minutes:
+        time += eco.advance(minutes - time)
+        if progress:
+            progress(time, org.count)
+        if eco.tracker[org].stalled(STALL_WINDOW):
+            stalled = True
+            break
+    return {'time': time,
+            'count': org.count,
+            'stalled': stalled,
+            'limitedBy': org.limitedBy()}
+
+def main(argv=None):
+    # cache imports this module, so import it here.
+    from cache import ResultCache, simulateCached, DEFAULT_DIR
+    parser = ArgumentParser(description='Run The Organism Trail simulation without graphics.')
+    parser.add_argument('--genes', default='',
+                        help='comma separated operon names, in the order they are added')
+    parser.add_argument('--minutes', type=int, default=TIME_LIMIT,
+                        help='simulated time limit in minutes (default %(default)s)')
+    parser.add_argument('--fast-forward', action='store_true',
+                        help='skip over stretches of pure exponential growth')
+    parser.add_argument('--profile', action='store_true',
+                        help='print per-phase timings and counters for the last cycles')
+    parser.add_argument('--record', metavar='FILE',
+                        help='save the per-minute trajectory to a .csv or .npy file')
+    parser.add_argument('--every', type=int, default=1,
+                        help='with --record, record one minute in this many (default %(default)s)')
+    parser.add_argument('--resources', default=None,
+                        help='with --record, comma separated resources to record (default: all)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIR, metavar='DIR',
+                        help='reuse and save results in a cache folder (default ' + DEFAULT_DIR + ')')
+    parser.add_argument('--list', action='store_true',
+                        help='list the operons that can be added and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for op in displayedGenes:
+            print op.name
+        return
+
+    geneNames = [name.strip() for name in args.genes.split(',') if name.strip()]
+    try:
+        eco = buildEcosystem(geneNames)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.every < 1:
+        parser.error("--every must be at least 1.")
+    if args.cache and (args.profile or args.record):
+        parser.error("--cache can't be used with --profile or --record.")
+    if args.profile:
+        eco.probe = Probe()
+    if args.record:
+        resources = None
+        if args.resources:
+            resources = [r.strip() for r in args.resources.split(',')]
+        try:
+            eco.recorder = Recorder(args.record, args.every, resources)
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        if args.cache:
+            result = simulateCached(ResultCache(args.cache), geneNames, None, args.minutes, args.fast_forward)
+        else:
+            result = simulate(eco, args.minutes, args.fast_forward)
+    finally:
+        if eco.recorder:
+            eco.recorder.close()
+    print "Time (minutes): " + str(result['time'])
+    print "Number of Cells: " + str(int(result['count']))
+    if result['stalled']:
+        if result['limitedBy']:
+            print "Your organism stopped growing due to: " + result['limitedBy']
+        else:
+            print "Your organism stopped growing"
+    else:
+        print "Time's Up!  Limited by: " + str(result['limitedBy'])
+    if args.profile:
+        print ""
+        eco.probe.printSummary()
+
+if __name__ == '__main__':
+    main()
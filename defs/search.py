@@ -0,0 +1,178 @@
+import random
+from argparse import ArgumentParser
+from itertools import combinations_with_replacement
+from multiprocessing import Pool, cpu_count
+from defaults import displayedGenes
+from run import TIME_LIMIT
+from cache import initWorker, simulateJob, DEFAULT_DIR
+
+# Searches the operon catalog for the genomes that grow the most cells.
+# Usage from the game folder:
+#   python -m defs.search --strategy beam --size 6 --top 10
+#
+# A candidate genome is a multiset of operon names (repeats are allowed, which
+# matters for DNA Polymerase).  It is always simulated in its canonical order,
+# sorted by name, so each multiset has exactly one score.
+
+# Returns the canonical form of a list of operon names.
+def canonical(names):
+    return tuple(sorted(names))
+
+# Simulates one canonical genome, or looks it up in the worker's result
+# cache.  This is what the worker processes run.
+def evaluate(args):
+    genome, minutes = args
+    return genome, simulateJob(genome, None, minutes)
+
+# Returns the score of a result: the final number of cells.
+def score(result):
+    return result['count']
+
+
+class GenomeSearch:
+    """Finds the best genomes from a catalog of operons, remembering every evaluation"""
+
+    # catalog is a list of operon names, defaulting to those shown in the game.
+    # processes is the size of the worker pool; 1 runs everything in this
+    # process, and None uses every core.  cacheDir is a result cache folder
+    # to share results with other runs, or None.
+    def __init__(self, catalog=None, minutes=TIME_LIMIT, processes=None, seed=None, cacheDir=None):
+        if catalog == None:
+            catalog = [op.name for op in displayedGenes]
+        self.catalog = sorted(catalog)
+        self.minutes = minutes
+        self.cacheDir = cacheDir
+        self.results = {}   # Canonical genome -> result of simulate()
+        self.rng = random.Random(seed)
+        self.processes = processes or cpu_count()
+        if self.processes == 1:
+            self.pool = None
+            initWorker(cacheDir)
+        else:
+            self.pool = Pool(self.processes, initWorker, (cacheDir,))
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    # Scores a list of genomes, only simulating the ones not seen before.
+    # Returns a list of (genome, result) pairs in the same order.
+    def evaluate(self, genomes):
+        genomes = [canonical(g) for g in genomes]
+        todo = []
+        queued = set()
+        for g in genomes:
+            if g not in self.results and g not in queued:
+                queued.add(g)
+                todo.append(g)
+        jobs = [(g, self.minutes) for g in todo]
+        if self.pool:
+            done = self.pool.map(evaluate, jobs, max(1, len(jobs) / (8 * self.processes)))
+        else:
+            done = map(evaluate, jobs)
+        for g, result in done:
+            self.results[g] = result
+        return [(g, self.results[g]) for g in genomes]
+
+    # Returns the k best (genome, result) pairs found so far.
+    def top(self, k=10):
+        ranked = sorted(self.results.items(), key=lambda x: (-score(x[1]), len(x[0]), x[0]))
+        return ranked[:k]
+
+    # Tries every multiset of up to size operons.  Only practical for small sizes.
+    def exhaustive(self, size, k=10):
+        genomes = []
+        for n in range(size + 1):
+            genomes.extend(combinations_with_replacement(self.catalog, n))
+        self.evaluate(genomes)
+        return self.top(k)
+
+    # Grows genomes one operon at a time, keeping the width best at each step.
+    def beam(self, size, width=10, k=10):
+        beam = [()]
+        self.evaluate(beam)
+        for n in range(size):
+            candidates = set()
+            for g in beam:
+                for name in self.catalog:
+                    candidates.add(canonical(g + (name,)))
+            scored = self.evaluate(list(candidates))
+            scored.sort(key=lambda x: (-score(x[1]), x[0]))
+            beam = [g for g, result in scored[:width]]
+        return self.top(k)
+
+    # Evolves a population of genomes of at most size operons, using
+    # tournament selection, crossover and add/remove/swap mutations.
+    def genetic(self, size, population=40, generations=20, mutation=0.3, k=10):
+        rng = self.rng
+        pop = []
+        for i in range(population):
+            pop.append(canonical([rng.choice(self.catalog) for j in range(rng.randint(0, size))]))
+
+        for gen in range(generations):
+            scored = self.evaluate(pop)
+
+            def pick():
+                a, b = rng.sample(scored, 2)
+                return a[0] if score(a[1]) >= score(b[1]) else b[0]
+
+            # Keep the best genome, then breed the rest of the next generation.
+            nextPop = [max(scored, key=lambda x: score(x[1]))[0]]
+            while len(nextPop) < population:
+                mom, dad = pick(), pick()
+                genes = list(mom + dad)
+                rng.shuffle(genes)
+                child = genes[:rng.randint(min(len(mom), len(dad)), max(len(mom), len(dad)))]
+                if rng.random() < mutation:
+                    action = rng.choice(('add', 'remove', 'swap'))
+                    if action == 'add' and len(child) < size:
+                        child.append(rng.choice(self.catalog))
+                    elif action == 'remove' and child:
+                        child.pop(rng.randrange(len(child)))
+                    elif action == 'swap' and child:
+                        child[rng.randrange(len(child))] = rng.choice(self.catalog)
+                nextPop.append(canonical(child[:size]))
+            pop = nextPop
+
+        self.evaluate(pop)
+        return self.top(k)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Search for the genomes that grow the most cells.')
+    parser.add_argument('--strategy', choices=('exhaustive', 'beam', 'genetic'), default='beam')
+    parser.add_argument('--size', type=int, default=4,
+                        help='maximum number of operons to add (default %(default)s)')
+    parser.add_argument('--width', type=int, default=10, help='beam width')
+    parser.add_argument('--population', type=int, default=40, help='genetic population size')
+    parser.add_argument('--generations', type=int, default=20, help='genetic generations')
+    parser.add_argument('--top', type=int, default=10, help='number of genomes to report')
+    parser.add_argument('--minutes', type=int, default=TIME_LIMIT)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIR, metavar='DIR',
+                        help='reuse and save results in a cache folder (default ' + DEFAULT_DIR + ')')
+    args = parser.parse_args(argv)
+
+    search = GenomeSearch(minutes=args.minutes, processes=args.processes, seed=args.seed,
+                          cacheDir=args.cache)
+    try:
+        if args.strategy == 'exhaustive':
+            best = search.exhaustive(args.size, args.top)
+        elif args.strategy == 'beam':
+            best = search.beam(args.size, args.width, args.top)
+        else:
+            best = search.genetic(args.size, args.population, args.generations, k=args.top)
+    finally:
+        search.close()
+
+    print "Evaluated " + str(len(search.results)) + " genomes."
+    for genome, result in best:
+        print str(int(result['count'])) + "\t" + ', '.join(genome)
+        print "\tlimited by: " + str(result['limitedBy'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import json
+import threading
+import Queue
+from argparse import ArgumentParser
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from multiprocessing import Pool, Queue as ProcessQueue, cpu_count
+from timeit import default_timer
+from constants import ENVR
+from run import buildEcosystem, simulate, TIME_LIMIT
+
+# A local HTTP/JSON service that runs simulations for many clients at once,
+# so a classroom can share one machine instead of each running the game.
+# Start it from the game folder with:
+#   python -m defs.service --port 8080
+#
+# POST /simulate with a JSON body like
+#   {"genes": ["Glucose Transporter", "Alcohol Fermentation"],
+#    "env": {"O2": 0.0}, "minutes": 180, "every": 10}
+# genes are names from defaults.operons, env overrides ENVR, and the others
+# are optional.  The reply is streamed as one JSON object per line: a
+# {"time": ..., "count": ...} line every `every` minutes, then a final line
+# holding the result of run.simulate() under "result" (or an "error").
+#
+# Simulations run in a pool of worker processes.  At most `queue` jobs wait
+# for a worker; past that, new jobs are turned away at once with a 503 and a
+# Retry-After header, so a busy server never piles up work.  GET /stats
+# returns the throughput and latency seen so far.
+
+# Progress messages from the workers, tagged with their job's number.
+progress = None
+
+def initWorker(queue):
+    global progress
+    progress = queue
+
+# Runs one job in a worker process, reporting its progress.  Returns the
+# result of the run, or an error message.
+def runJob(job, geneNames, envRes, minutes, every):
+    def report(time, count):
+        if time % every == 0:
+            progress.put((job, {'time': time, 'count': count}))
+    try:
+        return job, {'result': simulate(buildEcosystem(geneNames, envRes), minutes, progress=report)}
+    except Exception as e:
+        return job, {'error': str(e)}
+
+
+class Stats:
+    """Counts the jobs a service has handled and how long they took"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = default_timer()
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+        self.running = 0
+        self.latencies = []     # Seconds from request to result, most recent last.
+
+    def add(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def finish(self, latency, ok):
+        with self.lock:
+            self.running -= 1
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.latencies.append(latency)
+            if len(self.latencies) > 1000:
+                del self.latencies[:500]
+
+    def summary(self):
+        with self.lock:
+            elapsed = default_timer() - self.start
+            latencies = sorted(self.latencies)
+            summary = {'uptime': elapsed, 'done': self.done, 'failed': self.failed,
+                       'rejected': self.rejected, 'running': self.running,
+                       'jobsPerSec': self.done / elapsed}
+            if latencies:
+                summary['latencyMean'] = sum(latencies) / len(latencies)
+                summary['latencyP50'] = latencies[len(latencies) / 2]
+                summary['latencyP95'] = latencies[int(len(latencies) * 0.95)]
+            return summary
+
+
+class SimulationServer(ThreadingMixIn, HTTPServer):
+    """Accepts simulation jobs over HTTP and runs them on a bounded pool of processes"""
+
+    daemon_threads = True
+
+    # workers is the number of simulation processes, defaulting to one per
+    # core.  queue is how many jobs may wait for a worker before new ones
+    # are refused.
+    def __init__(self, address, workers=None, queue=None, maxMinutes=10 * TIME_LIMIT):
+        HTTPServer.__init__(self, address, Handler)
+        self.workers = workers or cpu_count()
+        if queue == None:
+            queue = 4 * self.workers
+        self.capacity = self.workers + queue
+        self.maxMinutes = maxMinutes
+        self.stats = Stats()
+        self.jobs = {}      # Job number -> Queue.Queue of messages for its handler.
+        self.nextJob = 0
+        self.lock = threading.Lock()
+        self.progress = ProcessQueue()
+        self.pool = Pool(self.workers, initWorker, (self.progress,))
+        dispatcher = threading.Thread(target=self.dispatch)
+        dispatcher.daemon = True
+        dispatcher.start()
+
+    # Hands the workers' progress messages to the handlers waiting for them.
+    def dispatch(self):
+        while True:
+            job, message = self.progress.get()
+            self.deliver(job, message)
+
+    def deliver(self, job, message):
+        with self.lock:
+            queue = self.jobs.get(job)
+        if queue:
+            queue.put(message)
+
+    # Queues a job if there is room, returning the queue its messages will
+    # arrive on, or None if the server is full.
+    def submit(self, geneNames, envRes, minutes, every):
+        with self.lock:
+            if len(self.jobs) >= self.capacity:
+                return None, None
+            job = self.nextJob
+            self.nextJob += 1
+            messages = self.jobs[job] = Queue.Queue()
+        self.stats.add('running')
+        self.pool.apply_async(runJob, (job, geneNames, envRes, minutes, every), callback=self.finish)
+        return job, messages
+
+    # Called when a job's worker is done with it.  Its slot is only freed
+    # now, even if its client went away earlier, so the pool never holds more
+    # than the server's capacity.
+    def finish(self, result):
+        job, message = result
+        self.deliver(job, message)
+        with self.lock:
+            del self.jobs[job]
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Handles one request to a SimulationServer"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code, body, headers=()):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.reply(200, self.server.stats.summary())
+        else:
+            self.reply(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        if self.path != '/simulate':
+            self.reply(404, {'error': 'Not found.'})
+            return
+        start = default_timer()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            geneNames, envRes, minutes, every = self.parse(request)
+        except (ValueError, TypeError) as e:
+            self.reply(400, {'error': str(e)})
+            return
+
+        job, messages = self.server.submit(geneNames, envRes, minutes, every)
+        if job == None:
+            self.server.stats.add('rejected')
+            self.reply(503, {'error': 'The server is busy, try again shortly.'}, [('Retry-After', '1')])
+            return
+
+        ok = False
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            while True:
+                message = messages.get()
+                self.wfile.write(json.dumps(message) + '\n')
+                self.wfile.flush()
+                if 'result' in message or 'error' in message:
+                    ok = 'result' in message
+                    break
+        except IOError:
+            # The client went away.  The job still finishes in its worker,
+            # and keeps its slot until then.
+            pass
+        finally:
+            self.server.stats.finish(default_timer() - start, ok)
+
+    # Checks a request's body, raising ValueError if it is malformed, and
+    # returns the job's gene names, environment overrides, minutes and
+    # progress interval.
+    def parse(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object.")
+        geneNames = request.get('genes', [])
+        if not isinstance(geneNames, list) or [name for name in geneNames if not isinstance(name, basestring)]:
+            raise ValueError("genes must be a list of operon names.")
+        envRes = request.get('env') or {}
+        for r in envRes:
+            if r not in ENVR:
+                raise ValueError("Unknown environmental resource: " + r)
+            envRes[r] = float(envRes[r])
+        minutes = int(request.get('minutes', TIME_LIMIT))
+        if not 0 < minutes <= self.server.maxMinutes:
+            raise ValueError("minutes must be between 1 and " + str(self.server.maxMinutes) + ".")
+        every = max(1, int(request.get('every', 10)))
+        # Catch unknown operons before the job is queued.
+        buildEcosystem(geneNames, envRes)
+        return geneNames, envRes, minutes, every
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Serve simulations over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='simulation processes (default: one per core)')
+    parser.add_argument('--queue', type=int, default=None,
+                        help='jobs that may wait for a worker before new ones are refused (default: 4 per worker)')
+    args = parser.parse_args(argv)
+
+    server = SimulationServer((args.host, args.port), args.workers, args.queue)
+    print "Serving on http://%s:%d with %d workers" % (args.host, args.port, server.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import csv
+import json
+import os
+from argparse import ArgumentParser
+from itertools import islice, product
+from multiprocessing import Pool, cpu_count
+from defaults import environments, ENVR
+from run import buildEcosystem, TIME_LIMIT
+from cache import initWorker, simulateJob, DEFAULT_DIR
+
+# Runs one genome across a grid of environments, on every core, and writes a
+# summary of each run as a row of a CSV file.  Usage from the game folder:
+#   python -m defs.sweep --genes "Glucose Transporter,Alcohol Fermentation" \
+#       --axis O2=0,0.1,0.2 --axis Glc=0:0.1:11 --out sweep.csv
+#
+# Each axis sets one environmental resource to each of its values, on top of
+# a base environment from defaults.environments.  The points of the grid are
+# numbered in the order itertools.product visits them, and the results file
+# records each point's number, so an interrupted sweep can be started again
+# with the same arguments and only runs the points that are missing.  Rows
+# are written as runs finish, so they are not in point order.  The sweep's
+# definition is saved beside its results (sweep.csv.sweep), and resuming
+# with a different one is refused.
+
+# Points are handed to the pool this many at a time per worker, so memory
+# stays flat however large the grid is.
+BATCH = 64
+
+COLUMNS = ['point', 'environment']
+RESULTS = ['count', 'time', 'stalled', 'limitedBy']
+
+
+# Returns the number of points in the grid made by axes, a list of
+# (resource, values) pairs.
+def gridSize(axes):
+    n = 1
+    for r, values in axes:
+        n *= len(values)
+    return n
+
+# Returns every point of the grid in order as (number, {resource: value}),
+# without building the grid in memory.
+def gridPoints(axes):
+    names = [r for r, values in axes]
+    for n, values in enumerate(product(*[values for r, values in axes])):
+        yield n, dict(zip(names, values))
+
+# Returns the file beside a results file that holds its sweep's definition.
+def definitionPath(path):
+    return path + '.sweep'
+
+# Cuts off whatever follows the last newline of the file f, open for reading
+# and writing.  The file is read back from its end a block at a time, so only
+# the last line is read however many rows come before it.
+def trimLastLine(f, block=4096):
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    while end > 0:
+        start = max(0, end - block)
+        f.seek(start)
+        i = f.read(end - start).rfind('\n')
+        if i >= 0:
+            f.truncate(start + i + 1)
+            return
+        end = start
+    f.truncate(0)
+
+# Simulates one point, or looks it up in the worker's result cache.  This is
+# what the worker processes run.
+def runPoint(args):
+    n, geneNames, envRes, minutes, fastForward = args
+    return n, simulateJob(geneNames, envRes, minutes, fastForward)
+
+# Parses an axis argument like 'O2=0,0.1,0.2', or 'O2=0:0.2:3' for three
+# evenly spaced values from 0 to 0.2, into a (resource, values) pair.
+def parseAxis(text):
+    if '=' not in text:
+        raise ValueError("Axes look like O2=0,0.1,0.2 or O2=0:0.2:3, not " + text)
+    r, values = text.split('=', 1)
+    r = r.strip()
+    if r not in ENVR:
+        raise ValueError("Unknown environmental resource: " + r)
+    if ':' in values:
+        lo, hi, count = values.split(':')
+        lo, hi, count = float(lo), float(hi), int(count)
+        if count < 2:
+            return r, [lo]
+        return r, [lo + (hi - lo) * k / (count - 1) for k in range(count)]
+    return r, [float(v) for v in values.split(',')]
+
+
+class Sweep:
+    """Runs a genome over a grid of environments, streaming the results to a CSV file"""
+
+    # geneNames is a list of operon names, as for run.buildEcosystem.  base
+    # names one of defaults.environments, and axes is a list of (resource,
+    # values) pairs.  processes is the size of the worker pool; 1 runs
+    # everything in this process, and None uses every core.  cacheDir is a
+    # result cache folder to share results with other runs, or None.
+    def __init__(self, geneNames, axes, base='Lab', minutes=TIME_LIMIT,
+                 fastForward=False, processes=None, cacheDir=None):
+        if base not in environments:
+            raise ValueError("Unknown environment: " + base)
+        # Check the genes before starting any workers.
+        buildEcosystem(geneNames)
+        self.geneNames = list(geneNames)
+        self.axes = axes
+        self.base = base
+        self.minutes = minutes
+        self.fastForward = fastForward
+        self.cacheDir = cacheDir
+        self.processes = processes or cpu_count()
+        self.size = gridSize(axes)
+        self.header = COLUMNS + [r for r, values in axes] + RESULTS
+        # Everything that decides the results, as it reads back from JSON.
+        self.definition = json.loads(json.dumps(
+            {'genes': self.geneNames, 'axes': axes, 'base': base, 'minutes': minutes,
+             'fastForward': bool(fastForward)}))
+
+    # Reads the points already in the results file at path into a bytearray
+    # with a 1 for each finished point.  A row cut off by an interruption is
+    # removed, so appending carries on from a clean line.
+    def finished(self, path):
+        done = bytearray(self.size)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return done
+        try:
+            with open(definitionPath(path)) as f:
+                definition = json.load(f)
+        except (IOError, ValueError):
+            definition = None
+        if definition != self.definition:
+            raise ValueError(path + " holds results for a different sweep.")
+        with open(path, 'rb+') as f:
+            trimLastLine(f)
+        with open(path, 'rb') as f:
+            reader = csv.reader(f)
+            if next(reader, None) != self.header:
+                raise ValueError(path + " holds results for a different sweep.")
+            for row in reader:
+                done[int(row[0])] = 1
+        return done
+
+    # Yields the jobs for every point not yet in done.
+    def jobs(self, done):
+        for n, point in gridPoints(self.axes):
+            if not done[n]:
+                envRes = dict(environments[self.base])
+                envRes.update(point)
+                yield (n, self.geneNames, envRes, self.minutes, self.fastForward)
+
+    # Runs every unfinished point, appending a row to the results file at
+    # path as each one finishes.  progress, if given, is called with the
+    # number of finished points and the grid size after each row.  Returns
+    # the number of points run.
+    def run(self, path, progress=None):
+        done = self.finished(path)
+        finished = sum(done)
+        ran = 0
+        pool = None
+        if self.processes > 1:
+            pool = Pool(self.processes, initWorker, (self.cacheDir,))
+        else:
+            initWorker(self.cacheDir)
+        try:
+            new = not os.path.exists(path) or os.path.getsize(path) == 0
+            with open(path, 'ab') as f:
+                writer = csv.writer(f)
+                if new:
+                    with open(definitionPath(path), 'w') as d:
+                        json.dump(self.definition, d)
+                    writer.writerow(self.header)
+                jobs = self.jobs(done)
+                while True:
+                    batch = list(islice(jobs, BATCH * self.processes))
+                    if not batch:
+                        break
+                    if pool:
+                        results = pool.imap_unordered(runPoint, batch, max(1, BATCH / 8))
+                    else:
+                        results = map(runPoint, batch)
+                    for n, result in results:
+                        writer.writerow(self.row(n, result))
+                        f.flush()
+                        finished += 1
+                        ran += 1
+                        if progress:
+                            progress(finished, self.size)
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        return ran
+
+    # Returns the results file row for point n.
+    def row(self, n, result):
+        point = [0] * len(self.axes)
+        k = n
+        for a in reversed(range(len(self.axes))):
+            values = self.axes[a][1]
+            point[a] = values[k % len(values)]
+            k //= len(values)
+        return ([n, self.base] + [repr(v) for v in point] +
+                [repr(result['count']), result['time'], int(result['stalled']),
+                 result['limitedBy'] or ''])
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Run a genome over a grid of environments.')
+    parser.add_argument('--genes', default='',
+                        help='comma separated operon names, in the order they are added')
+    parser.add_argument('--axis', action='append', default=[], metavar='RES=VALUES',
+                        help='a resource and its values, like O2=0,0.1,0.2 or O2=0:0.2:3; repeatable')
+    parser.add_argument('--env', default='Lab', choices=sorted(environments),
+                        help='base environment (default %(default)s)')
+    parser.add_argument('--out', default='sweep.csv',
+                        help='results file, resumed if it exists (default %(default)s)')
+    parser.add_argument('--minutes', type=int, default=TIME_LIMIT)
+    parser.add_argument('--fast-forward', action='store_true',
+                        help='skip over stretches of pure exponential growth')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIR, metavar='DIR',
+                        help='reuse and save results in a cache folder (default ' + DEFAULT_DIR + ')')
+    args = parser.parse_args(argv)
+
+    geneNames = [name.strip() for name in args.genes.split(',') if name.strip()]
+    try:
+        axes = [parseAxis(a) for a in args.axis]
+        sweep = Sweep(geneNames, axes, args.env, args.minutes, args.fast_forward, args.processes,
+                      args.cache)
+        sweep.finished(args.out)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def progress(finished, size):
+        if finished % 100 == 0 or finished == size:
+            print str(finished) + " of " + str(size) + " points"
+
+    ran = sweep.run(args.out, progress)
+    print "Ran " + str(ran) + " points; results are in " + args.out
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,62 @@
-import pygame, random, sys, os
+import pygame, random, sys, os, threading, math
+from argparse import ArgumentParser
+from timeit import default_timer
+startTime = default_timer()
 from pygame.locals import *
 from defs.defaults import *
-
-# Initialize
-pygame.init()
+from defs.run import STALL_WINDOW, TIME_LIMIT
+from defs.cache import ResultCache, runKey
+
+parser = ArgumentParser(description='The Organism Trail')
+parser.add_argument('--startup-time', action='store_true',
+                    help='print how long each stage of startup took')
+parser.add_argument('--quit-after-startup', action='store_true',
+                    help='quit as soon as the main menu is shown, e.g. to time startup')
+parser.add_argument('--no-cache', action='store_true',
+                    help="don't reuse or save the results of earlier games")
+args = parser.parse_args()
+
+# Organisms that have been grown before are played back from the result
+# cache instead of simulated again.
+resultCache = None
+if not args.no_cache:
+    try:
+        resultCache = ResultCache()
+    except (IOError, OSError):
+        pass
+
+# Startup stages and the seconds since main.py started when each finished.
+startupTimes = []
+def mark(stage):
+    startupTimes.append((stage, default_timer() - startTime))
+
+# Initialize only the parts of Pygame the game uses.  pygame.init() also
+# starts the mixer and joysticks, which can be slow to come up.
+pygame.display.init()
+pygame.font.init()
 pygame.display.set_caption('The Organism Trail')
 screen = pygame.display.set_mode((800,600))
 FPS = 30
+# Simulated minutes per second at each speed.  Max runs as many minutes as
+# fit in each frame.
+SPEEDS = {'1x': 8, '4x': 32, '16x': 128, 'Max': None}
+SPEED_NAMES = ['1x', '4x', '16x', 'Max']
+# Internal resources shown as sparklines under the growth chart.
+SPARKLINES = ['ATP', 'Glc', 'O2']
+# Events after which the window's contents may have been lost, so the whole
+# display is redrawn.  Pygame 2 also reports these as window events.
+REDRAW_EVENTS = [VIDEOEXPOSE, VIDEORESIZE, ACTIVEEVENT]
+if hasattr(pygame, 'WINDOWEVENT'):
+    REDRAW_EVENTS.append(pygame.WINDOWEVENT)
 clock = pygame.time.Clock()
 IMG_DIR = os.path.join('data', 'img')
 
-# Prepare the splash and background images for Pygame.
+# Prepare the splash image for Pygame.  The background is loaded while the
+# splash screen is up (see loadAssets).
 splash = pygame.image.load(os.path.join(IMG_DIR, 'splash.png'))
 splash = splash.convert()
-background = pygame.image.load(os.path.join(IMG_DIR, 'background.png'))
-background = background.convert()
+background = None
+mark('display ready')
 
 # The main code is something of a mess currently.  This file handles all of
 # the game's GUI, menu logic, etc.  All the cellular simulation occurs in
@@ -28,10 +70,59 @@ class Game():
     def __init__(self):
         self.toDraw = []
         self.playerOps = []
-        self.org = Organism('', {}, {})
+        self.org = Organism('', Genome([]), cellTolerances)
         self.eco = None
         self.time = 0
+        self.count = int(self.org.count)
         self.play = False
+        self.speed = '1x'
+        self.replay = None      # A cached run of the organism being grown, if any.
+        self.cacheKey = None
+        self.chart = None
+
+    # Runs one minute of the simulation and checks if the game is over.
+    # Returns False once the simulation should stop.
+    def step(self):
+        self.time = self.time + 1
+        if self.replay:
+            # This organism has been grown before, so play back the cached run.
+            self.count = int(self.replay['counts'].get(self.time, self.count))
+            stalled = self.replay['stalled'] and self.time >= self.replay['time']
+        else:
+            # Run an ecosystem cycle, then update the count.
+            self.eco.cycle()
+            self.count = int(self.eco.orgs[0].count)
+            stalled = self.eco.tracker[self.eco.orgs[0]].stalled(STALL_WINDOW)
+        self.chart.add(self.time, self.count, None if self.replay else self.eco.orgs[0].res)
+
+        # If it hasn't grown at all since 10 minutes, then stop.
+        if stalled:
+            if self.replay:
+                limitedBy = self.replay['limitedBy']
+            else:
+                limitedBy = self.eco.orgs[0].limitedBy()
+            self.play = False
+
+            # If we know why they stopped growing, then tell the player.
+            if limitedBy:
+                gameOverMenu = Menu("GameOver", ("Game Over", "Your organism stopped growing due to:", limitedBy))
+            else:
+                gameOverMenu = Menu("GameOver", ('Game Over', "Your organism stopped growing"))
+            self.toDraw.append(gameOverMenu)
+
+        # Also stop after 3 game hours.
+        if self.time >= TIME_LIMIT:
+            self.play = False
+            gameOverMenu = Menu("GameOver", ("Time's Up!", ))
+            self.toDraw.append(gameOverMenu)
+
+        # Remember how a new organism did, so it can be played back next time.
+        if not self.play and resultCache and not self.replay:
+            org = self.eco.orgs[0]
+            resultCache.putRun(self.cacheKey, self.eco, {'time': self.time, 'count': org.count,
+                                                         'stalled': stalled, 'limitedBy': org.limitedBy()})
+
+        return self.play
 
     # If a menu has a button clicked, then it passes that information here.
     # From here we can redraw stuff, pause simulation, etc.
@@ -40,7 +131,7 @@ class Game():
         # and update the player genes menue to be drawn.
         if menu.name == 'Genes':
             self.playerOps.append(operons[button.text])
-            self.toDraw[1] = Menu("PGenes", [op.name for op in self.playerOps], center=(background.get_width()/4, None), fontSize=20, fontSpace=1)
+            self.toDraw[1].setItems([op.name for op in self.playerOps])
         
         # If in the main menu, either quit or load the next menu.
         elif menu.name == 'Main':
@@ -54,7 +145,7 @@ class Game():
         # from the list, and updates that list for when it is redrawn.
         elif menu.name == 'PGenes':
             self.playerOps.remove(operons[button.text])
-            self.toDraw[1] = Menu("PGenes", [op.name for op in self.playerOps], center=(background.get_width()/4, None), fontSize=20, fontSpace=1)
+            self.toDraw[1].setItems([op.name for op in self.playerOps])
         
         # If the player clicks Go, then we need to create their organism,
         # initialize an environment and ecosystem, then load the menus for
@@ -62,10 +153,21 @@ class Game():
         elif menu.name == 'Go':
             self.playerOps = hiddenGenes + self.playerOps
             genome = Genome(self.playerOps)
-            self.org = Organism('Player Organism', genome, copy.deepcopy(CELLR))
+            self.org = Organism('Player Organism', genome, cellTolerances)
             env = Environment('Game Environment', 1, ENVR)
             self.eco = Ecosystem([self.org], env)
-            self.toDraw = [playButtonMenu, pauseButtonMenu, timeMenu, countMenu, quitButtonMenu]
+            self.count = int(self.org.count)
+            self.replay = None
+            if resultCache:
+                self.cacheKey = runKey(self.eco, TIME_LIMIT)
+                cached = resultCache.get(self.cacheKey)
+                if cached and 'trajectory' in cached:
+                    cached['counts'] = dict([(int(m), c) for m, c in cached['trajectory']])
+                    self.replay = cached
+            # The chart goes last, as the time and count are found by index.
+            self.chart = GrowthChart((150, 75, 500, 200))
+            self.chart.add(0, self.org.count, None if self.replay else self.org.res)
+            self.toDraw = [playButtonMenu, pauseButtonMenu, timeMenu, countMenu, quitButtonMenu, speedMenu, self.chart]
         
         # These should be self explanatory.
         elif menu.name == 'Play':
@@ -73,21 +175,109 @@ class Game():
         
         elif menu.name == 'Pause':
             self.play = False
+
+        elif menu.name == 'Speed':
+            if button.text in SPEEDS:
+                self.setSpeed(button.text)
         
         elif menu.name == 'Quit':
             sys.exit()
 
+    def setSpeed(self, speed):
+        self.speed = speed
+        scheduler.setRate(SPEEDS[speed])
+        speedMenu.setText(0, 'Speed: ' + speed)
+
+
+class Scheduler():
+    """Runs simulation steps at a steady rate, independent of the frame rate"""
+
+    # step is called once per simulated minute and returns False to stop.
+    # rate is in steps per second, or None to run as many steps as fit.
+    # Steps never take more than budget seconds of a frame, so drawing and
+    # input handling keep up however fast the simulation runs.
+    def __init__(self, step, rate, budget):
+        self.step = step
+        self.rate = rate
+        self.budget = budget
+        self.owed = 0.0
+        self.last = None
+
+    def setRate(self, rate):
+        self.rate = rate
+        self.owed = 0.0
+
+    # Forgets the time since the last run, e.g. while paused.
+    def reset(self):
+        self.last = None
+        self.owed = 0.0
+
+    # Runs the steps owed since the last call.  Returns how many ran.
+    def run(self):
+        start = default_timer()
+        if self.last == None:
+            self.last = start
+        if self.rate:
+            # Catch up on at most one second, so a slow machine doesn't fall
+            # further and further behind.
+            self.owed = min(self.owed + (start - self.last) * self.rate, self.rate)
+        self.last = start
+
+        deadline = start + self.budget
+        steps = 0
+        while (self.rate == None or self.owed >= 1) and default_timer() < deadline:
+            steps += 1
+            if self.rate:
+                self.owed -= 1
+            if not self.step():
+                self.reset()
+                break
+        return steps
+
+
+# Fonts and rendered text are cached, so menus don't build a new font or
+# re-render their text every time they are created or drawn.
+fonts = {}
+textCache = {}
+TEXT_CACHE_SIZE = 512
+
+def getFont(fontSize):
+    if fontSize not in fonts:
+        fonts[fontSize] = pygame.font.Font(None, fontSize)
+    return fonts[fontSize]
+
+# Returns a surface with the text rendered on it, from the cache if possible.
+def renderText(text, fontSize, antialias=1, color=(255,255,255), background=None):
+    key = (text, fontSize, antialias, color, background)
+    if key not in textCache:
+        # Changing numbers would fill the cache forever, so start over when full.
+        if len(textCache) >= TEXT_CACHE_SIZE:
+            textCache.clear()
+        if background == None:
+            textCache[key] = getFont(fontSize).render(text, antialias, color)
+        else:
+            textCache[key] = getFont(fontSize).render(text, antialias, color, background)
+    return textCache[key]
 
-class MenuItem(pygame.font.Font):
+
+class MenuItem():
     def __init__(self, text, position, fontSize=36, antialias=1, color=(255,255,255), background=None):
-        pygame.font.Font.__init__(self, None, fontSize)
+        self.fontSize = fontSize
+        self.antialias = antialias
+        self.color = color
+        self.background = background
+        self.text = None
+        self.center = position
+        self.setText(text)
+
+    # Changes the text, only rendering it again if it is different.
+    def setText(self, text):
+        if text == self.text:
+            return
         self.text = text
-        if background == None:
-            self.textSurface = self.render(self.text, antialias, color)
-        else:
-            self.textSurface = self.render(self.text, antialias, color, background)
-        self.position = self.textSurface.get_rect(centerx=position[0], centery=position[1])
-    
+        self.textSurface = renderText(text, self.fontSize, self.antialias, self.color, self.background)
+        self.position = self.textSurface.get_rect(centerx=self.center[0], centery=self.center[1])
+
     def get_pos(self):
         return self.position
     
@@ -97,6 +287,10 @@ class MenuItem(pygame.font.Font):
     def get_surface(self):
         return self.textSurface
 
+    # Returns the (surface, rect) pairs that make up this item on screen.
+    def blits(self):
+        return [(self.textSurface, tuple(self.position))]
+
     def draw(self, screen):
         screen.blit(self.get_surface(), self.get_pos())
 
@@ -108,18 +302,16 @@ class Menu():
         self.name = name
         screen = pygame.display.get_surface()
         self.area = screen.get_rect()
-        self.background = background
         self.active=False
-        font = pygame.font.Font(None, fontSize)
         menuHeight = (fontSize+fontSpace)*len(items)
         if center[0]:
             centerX = center[0]
         else:
-            centerX = self.background.get_width()/2
+            centerX = self.area.width/2
         if center[1]:
             startY = center[1]
         else:
-            startY = self.background.get_height()/2 - menuHeight/2
+            startY = self.area.height/2 - menuHeight/2
             
         self.items = list()
         for item in items:
@@ -128,6 +320,16 @@ class Menu():
             self.items.append(newItem)
             startY = startY + fontSize + fontSpace
 
+    # Changes the text of one item, only rendering it again if it is different.
+    def setText(self, index, text):
+        self.items[index].setText(text)
+
+    # Returns the (surface, rect) pairs that make up this menu on screen.
+    # Like draw(), this activates the menu.
+    def blits(self):
+        self.active = True
+        return [(item.textSurface, tuple(item.position)) for item in self.items]
+
     def draw(self, screen):
         self.active = True
         for item in self.items:
@@ -152,90 +354,376 @@ class Menu():
                 if eventX > textPos.left and eventX < textPos.right and eventY > textPos.top and eventY < textPos.bottom:
                     game.handleButton(self, item)
 
+
+class ScrollList():
+    """A scrolling list of buttons, of which only the rows in view are built and drawn"""
+
+    # The rows fill rect from the top, and the mouse wheel scrolls them.
+    # Row text comes from the text cache, so scrolling back over rows that
+    # have been seen reuses their surfaces.  Clicks are passed to the game
+    # like a Menu's, as the MenuItem of the row under the mouse.
+    def __init__(self, name, items, rect, fontSize=20, fontSpace=1, wheelRows=3):
+        self.name = name
+        self.rect = pygame.Rect(rect)
+        self.fontSize = fontSize
+        self.rowHeight = fontSize + fontSpace
+        self.shown = max(1, self.rect.height // self.rowHeight)
+        self.wheelRows = wheelRows
+        self.active = False
+        self.top = 0
+        self.thumb = None
+        self.setItems(items)
+
+    # Replaces the list's text, keeping the scroll position where possible.
+    def setItems(self, items):
+        self.items = list(items)
+        if len(self.items) > self.shown:
+            height = max(8, self.rect.height * self.shown // len(self.items))
+            if self.thumb == None or self.thumb.get_height() != height:
+                self.thumb = pygame.Surface((4, height))
+                self.thumb.fill((180,180,180))
+        else:
+            self.thumb = None
+        self.scroll(0)
+
+    # Scrolls by a number of rows, down if positive, and builds the rows now
+    # in view.
+    def scroll(self, rows):
+        self.top = max(0, min(self.top + rows, len(self.items) - self.shown))
+        y = self.rect.top + self.rowHeight / 2
+        self.rows = [MenuItem(self.items[i], (self.rect.centerx, y + (i - self.top) * self.rowHeight), fontSize=self.fontSize)
+                     for i in range(self.top, min(len(self.items), self.top + self.shown))]
+
+    # Returns the (surface, rect) pairs of the rows in view, and of the
+    # scroll bar if not everything fits.  Like Menu.blits(), this activates
+    # the list.
+    def blits(self):
+        self.active = True
+        blits = [(row.textSurface, tuple(row.position)) for row in self.rows]
+        if self.thumb:
+            y = self.rect.top + (self.rect.height - self.thumb.get_height()) * self.top // (len(self.items) - self.shown)
+            blits.append((self.thumb, (self.rect.right - 4, y) + self.thumb.get_size()))
+        return blits
+
+    def deactivate(self):
+        self.active = False
+
+    # Mouse buttons 4 and 5 are the wheel.  The row clicked is worked out
+    # from the height of the rows rather than by testing each one.
+    def handleEvent(self, event, game):
+        if event.type != MOUSEBUTTONDOWN or not self.active or not self.rect.collidepoint(event.pos):
+            return
+        if event.button == 4:
+            self.scroll(-self.wheelRows)
+        elif event.button == 5:
+            self.scroll(self.wheelRows)
+        elif event.button == 1:
+            row = (event.pos[1] - self.rect.top) // self.rowHeight
+            if row < len(self.rows):
+                game.handleButton(self, self.rows[row])
+
+
+class Renderer():
+    """Draws the game's drawing queue, only updating the parts of the display that changed"""
+
+    def __init__(self, screen, background):
+        self.screen = screen
+        self.background = background
+        self.drawn = []      # The (surface, rect) pairs currently on screen.
+        self.full = True     # Whether the whole display needs redrawing.
+
+    # Forces the next render to redraw and flip the whole display.
+    def invalidate(self):
+        self.full = True
+
+    # Items may also have a changed() method, returning the rects of the
+    # screen they drew over in place since the last frame.
+    def render(self, toDraw):
+        blits = []
+        changed = []
+        for d in toDraw:
+            blits.extend(d.blits())
+            if hasattr(d, 'changed'):
+                changed.extend(d.changed())
+
+        if self.full:
+            self.screen.blit(self.background, (0,0))
+            for surface, rect in blits:
+                self.screen.blit(surface, rect)
+            pygame.display.flip()
+            self.full = False
+        else:
+            # Anything that appeared, disappeared or moved is dirty.  Cached
+            # text surfaces are reused, so unchanged items compare equal.
+            # Each dirty rect is redrawn from the background up, clipped to
+            # the rect, so translucent surfaces overlapping it aren't drawn
+            # over themselves outside it.
+            dirty = [pygame.Rect(rect) for surface, rect in set(self.drawn) ^ set(blits)] + changed
+            if dirty:
+                for rect in dirty:
+                    self.screen.set_clip(rect)
+                    self.screen.blit(self.background, rect, rect)
+                    for surface, r in blits:
+                        if rect.colliderect(r):
+                            self.screen.blit(surface, r)
+                self.screen.set_clip(None)
+                pygame.display.update(dirty)
+        self.drawn = blits
+
+class GrowthChart():
+    """A live chart of the cell count on a log scale, with sparklines of internal resources"""
+
+    # Points are drawn onto an off-screen surface as they arrive, so each
+    # frame only draws the new ones.  At most one point is kept per pixel
+    # column; when a run outgrows the time axis its span doubles and the
+    # kept points are thinned to fit.  The count axis grows a decade at a
+    # time, and a sparkline only widens its range when a value falls outside
+    # it, so the whole chart is rarely redrawn.
+    def __init__(self, rect, span=TIME_LIMIT, resources=SPARKLINES):
+        self.rect = pygame.Rect(rect)
+        self.surface = pygame.Surface(self.rect.size, SRCALPHA)
+        self.resources = resources
+        self.idx = [RIDX[r] for r in resources]
+        self.showSparklines = True
+        # The plot area for the count, and a strip below it for each sparkline.
+        width, height = self.rect.size
+        self.left = 44
+        self.width = width - self.left - 4
+        self.stripHeight = 22
+        self.top = 6
+        self.bottom = height - len(resources) * self.stripHeight - 14
+        self.span = span
+        self.columns = {}   # Pixel column -> (minute, count, resource values or None)
+        self.pending = []
+        self.last = None    # The column and values of the last point drawn.
+        self.low, self.high = 1, 3  # The count axis runs from 10**low to 10**high.
+        self.ranges = [None] * len(resources)   # (low, high) of each sparkline.
+        self.redraw()
+
+    # Queues a point to be drawn on the next frame.  res may be None if the
+    # resources aren't known, e.g. when playing back a cached run.
+    def add(self, minute, count, res=None):
+        if res != None:
+            res = [res[i] for i in self.idx]
+        self.pending.append((minute, count, res))
+
+    def toggleSparklines(self):
+        self.showSparklines = not self.showSparklines
+        self.redraw()
+        self.pending.append(None)
+
+    def column(self, minute):
+        return self.left + min(self.width, minute * self.width // self.span)
+
+    def countY(self, count):
+        scaled = (math.log10(max(count, 1)) - self.low) / (self.high - self.low)
+        return self.bottom - int(scaled * (self.bottom - self.top))
+
+    def sparkY(self, k, value):
+        low, high = self.ranges[k]
+        top = self.bottom + 14 + k * self.stripHeight
+        scaled = (value - low) / (high - low) if high > low else 0.5
+        return top + self.stripHeight - 4 - int(scaled * (self.stripHeight - 6))
+
+    # Widens the axes to fit a point, returning True if the chart must be
+    # redrawn.
+    def fit(self, minute, count, values):
+        full = False
+        while minute > self.span:
+            self.span *= 2
+            thinned = {}
+            for m, c, v in sorted(self.columns.values()):
+                thinned[self.column(m)] = (m, c, v)
+            self.columns = thinned
+            full = True
+        decade = math.log10(max(count, 1))
+        if decade > self.high:
+            self.high = int(math.ceil(decade))
+            full = True
+        if decade < self.low:
+            self.low = int(math.floor(decade))
+            full = True
+        if values != None:
+            for k, v in enumerate(values):
+                if self.ranges[k] == None:
+                    self.ranges[k] = (v * 0.9, v * 1.1)
+                    full = True
+                elif not self.ranges[k][0] <= v <= self.ranges[k][1]:
+                    low, high = self.ranges[k]
+                    margin = (max(high, v) - min(low, v)) * 0.25
+                    self.ranges[k] = (min(low, v - margin), max(high, v + margin))
+                    full = True
+        return full
+
+    # Draws the points added since the last frame, returning the rects of
+    # the screen that changed.
+    def changed(self):
+        if not self.pending:
+            return []
+        full = False
+        new = []
+        for point in self.pending:
+            if point == None:
+                full = True
+                continue
+            minute, count, values = point
+            full = self.fit(minute, count, values) or full
+            x = self.column(minute)
+            self.columns[x] = point
+            new.append(x)
+        self.pending = []
+        if full:
+            self.redraw()
+            return [self.rect]
+
+        start = self.last[0] if self.last else new[0]
+        for x in sorted(set(new)):
+            self.drawSegment(self.last, (x, self.columns[x]))
+            self.last = (x, self.columns[x])
+        return [pygame.Rect(self.rect.left + start - 1, self.rect.top, self.last[0] - start + 3, self.rect.height)]
+
+    # Draws the lines from one (column, point) to the next.
+    def drawSegment(self, a, b):
+        if a == None:
+            a = b
+        (x0, (m0, c0, v0)), (x1, (m1, c1, v1)) = a, b
+        pygame.draw.line(self.surface, (120,255,120), (x0, self.countY(c0)), (x1, self.countY(c1)), 2)
+        if self.showSparklines and v0 != None and v1 != None:
+            for k in range(len(self.idx)):
+                pygame.draw.line(self.surface, (255,220,120), (x0, self.sparkY(k, v0[k])), (x1, self.sparkY(k, v1[k])))
+
+    # Draws the whole chart again from the kept points.
+    def redraw(self):
+        self.surface.fill((0,0,0,150))
+        white = (255,255,255)
+        pygame.draw.line(self.surface, white, (self.left, self.top), (self.left, self.bottom))
+        pygame.draw.line(self.surface, white, (self.left, self.bottom), (self.left + self.width, self.bottom))
+        for decade in range(self.low, self.high + 1):
+            y = self.countY(10**decade)
+            pygame.draw.line(self.surface, white, (self.left - 4, y), (self.left, y))
+            label = renderText('1e%d' % decade, 16)
+            self.surface.blit(label, label.get_rect(right=self.left - 6, centery=y))
+        if self.showSparklines:
+            for k, r in enumerate(self.resources):
+                label = renderText(r, 16)
+                top = self.bottom + 14 + k * self.stripHeight
+                self.surface.blit(label, label.get_rect(right=self.left - 6, centery=top + self.stripHeight / 2 - 2))
+        self.last = None
+        for x in sorted(self.columns):
+            self.drawSegment(self.last, (x, self.columns[x]))
+            self.last = (x, self.columns[x])
+
+    def blits(self):
+        return [(self.surface, tuple(self.rect))]
+
+    def handleEvent(self, event, game):
+        pass
+
+
+# Loads the background and builds all of the menus we will need to use.
+# This runs in a thread while the splash screen is up, so the splash only
+# stays as long as loading takes.
+def loadAssets():
+    global background, mainMenu, addGenesMenu, playerGenesMenu, goButtonMenu, addGenesTitle
+    global playButtonMenu, pauseButtonMenu, quitButtonMenu, timeMenu, countMenu, speedMenu
+    try:
+        background = pygame.image.load(os.path.join(IMG_DIR, 'background.png'))
+        mark('background loaded')
+
+        mainMenu = Menu("Main", ("Start", "Quit"))
+        addGenesList = [op.name for op in displayedGenes]
+        # The operon lists fill the columns between the title and the Go
+        # button, and scroll if they are longer.  They stop short of the
+        # button, since clicks on their rows are taken across the column.
+        width, height = background.get_size()
+        listRect = (10, height*3/20, width/2 - 20, height*8/10 - 40 - height*3/20)
+        addGenesMenu = ScrollList("Genes", addGenesList, pygame.Rect(listRect).move(width/2, 0))
+        playerGenesMenu = ScrollList("PGenes", [op.name for op in game.playerOps], listRect)
+        goButtonMenu = Menu("Go", ('Go!',), center=(background.get_width()/2, background.get_height()*8/10))
+        addGenesTitle = MenuItem("Click operons on right to add, click operons on left to remove", (background.get_width()/2, background.get_height()/10))
+        playButtonMenu = Menu("Play", ('Play',), center=(background.get_width()/2, background.get_height()/16))
+        pauseButtonMenu = Menu("Pause", ('Pause',), center=(background.get_width()*1/4, background.get_height()/16))
+        quitButtonMenu= Menu("Quit", ('Quit',), center=(background.get_width()*3/4, background.get_height()/16))
+        timeMenu = Menu('Time', ('Time (minutes):', str(game.time)), center=(background.get_width()*1/4, background.get_height()*8/10))
+        countMenu = Menu('Cells', ('Number of Cells:', str(game.org.count)), center=(background.get_width()*3/4, background.get_height()*8/10))
+        speedMenu = Menu('Speed', ['Speed: ' + game.speed] + SPEED_NAMES, center=(background.get_width()/2, background.get_height()*6/10), fontSize=24)
+        mark('menus built')
+    except Exception:
+        loadErrors.append(sys.exc_info())
+
 # Initialize a game.
 game = Game()
 
-# Draw the splash screen and title text.  Then wait 3 seconds and move on.
+# Draw the splash screen and title text, then load everything else behind
+# it, still answering the window so it can be closed.
 screen.blit(splash, (0,0))
 splashMenu = Menu("Splash", ("The Organism Trail",), fontSize=80)
 splashMenu.draw(screen)
 pygame.display.flip()
-pygame.time.wait(3000)
-screen.blit(background, (0,0))
-
-# Define all of the menus and items we will need to use.
-mainMenu = Menu("Main", ("Start", "Quit"))
-addGenesList = [op.name for op in displayedGenes]
-addGenesMenu = Menu("Genes", addGenesList, center=(background.get_width()*3/4, None), fontSize=20, fontSpace=1)
-playerGenesMenu = Menu("PGenes", [op.name for op in game.playerOps], center=(background.get_width()/4, None), fontSize=20, fontSpace=1)
-goButtonMenu = Menu("Go", ('Go!',), center=(background.get_width()/2, background.get_height()*8/10))
-addGenesTitle = MenuItem("Click operons on right to add, click operons on left to remove", (background.get_width()/2, background.get_height()/10))
-playButtonMenu = Menu("Play", ('Play',), center=(background.get_width()/2, background.get_height()/16))
-pauseButtonMenu = Menu("Pause", ('Pause',), center=(background.get_width()*1/4, background.get_height()/16))
-quitButtonMenu= Menu("Quit", ('Quit',), center=(background.get_width()*3/4, background.get_height()/16))
-timeMenu = Menu('Time', ('Time (minutes):', str(game.time)), center=(background.get_width()*1/4, background.get_height()*8/10))
-countMenu = Menu('Cells', ('Number of Cells:', str(game.org.count)), center=(background.get_width()*3/4, background.get_height()*8/10))
-
-# Queue the main menu to be drawn.
+mark('splash shown')
+
+loadErrors = []
+loader = threading.Thread(target=loadAssets)
+loader.daemon = True
+loader.start()
+while loader.is_alive():
+    loader.join(1.0 / FPS)
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+            sys.exit()
+if loadErrors:
+    raise loadErrors[0][0], loadErrors[0][1], loadErrors[0][2]
+background = background.convert()
+
+# Simulation steps may use most of each frame, leaving the rest for drawing.
+scheduler = Scheduler(game.step, SPEEDS[game.speed], 0.6 / FPS)
+
+# Queue the main menu to be drawn, and draw it.
 game.toDraw = [mainMenu]
+renderer = Renderer(screen, background)
+renderer.render(game.toDraw)
+mark('main menu shown')
+
+if args.startup_time:
+    for stage, seconds in startupTimes:
+        print stage.ljust(20) + "%.3f s" % seconds
+if args.quit_after_startup:
+    sys.exit()
 
 # This is the main game loop.
 while True:
     # Limits the FPS of the game.
     clock.tick(FPS)
 
-    # Load a blank background.
-    screen.blit(background, (0,0))
-
-    # Draw everything in the game's drawing queue.
-    for i in game.toDraw:
-        i.draw(screen)
-
-    # Update the display.
-    pygame.display.flip()
+    # Draw everything in the game's drawing queue, updating only what changed.
+    renderer.render(game.toDraw)
 
     # game.play determines whether or not to execute the cellular simulation logic.
+    # The scheduler runs as many minutes as the speed calls for this frame.
     if game.play:
-        # Run an ecosystem cycle, then update the time and count.
-        game.eco.cycle()
-        game.time = game.time + 1
-        game.count = int(game.eco.orgs[0].count)
-
-        # If it hasn't grown at all since 10 minutes, then stop.
-        if len(game.eco.tracker[game.eco.orgs[0]]) > 10 and game.eco.tracker[game.eco.orgs[0]][-10] == game.eco.tracker[game.eco.orgs[0]][-1]:
-            limitedBy = game.eco.orgs[0].limitedBy()
-            game.play = False
-
-            # If we know why they stopped growing, then tell the player.
-            if limitedBy:
-                gameOverMenu = Menu("GameOver", ("Game Over", "Your organism stopped growing due to:", limitedBy))
-            else:
-                gameOverMenu = Menu("GameOver", ('Game Over', "Your organism stopped growing"))
-            game.toDraw.append(gameOverMenu)
-            pygame.display.flip()
-
-        # Also stop after 3 game hours.
-        if game.time >= 180:
-            game.play = False
-            gameOverMenu = Menu("GameOver", ("Time's Up!", ))
-            game.toDraw.append(gameOverMenu)
-            pygame.display.flip()
-
-        # Update the drawing queue with the new time and cell count.
-        game.toDraw[2] = Menu('Time', ('Time (minutes):', str(game.time)), center=(background.get_width()*1/4, background.get_height()*8/10))
-        game.toDraw[3] = Menu('Cells', ('Number of Cells:', str(game.count)), center=(background.get_width()*3/4, background.get_height()*8/10))
-
-        # Limits the rate at which the ecosystem cycles.  Can decrease or remove this to run faster.
-        pygame.time.wait(125)
+        if scheduler.run():
+            # Update the time and cell count shown.
+            game.toDraw[2].setText(1, str(game.time))
+            game.toDraw[3].setText(1, str(game.count))
+    else:
+        scheduler.reset()
 
     # Handle all the Pygame events.
     for event in pygame.event.get():
         # Exit the program if the window is closed or escape is hit.
         if event.type == pygame.QUIT:
             sys.exit()
+        elif event.type in REDRAW_EVENTS:
+            renderer.invalidate()
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 sys.exit()
+            # The number keys also pick the speed while growing.
+            elif game.eco and event.key in (K_1, K_2, K_3, K_4):
+                game.setSpeed(SPEED_NAMES[event.key - K_1])
+            # S shows or hides the resource sparklines under the chart.
+            elif game.chart and event.key == pygame.K_s:
+                game.chart.toggleSparklines()
 
         # If they click the mouse, then pass the event to every menu
         # currently being drawn so they can process it if necessary.
@@ -0,0 +1,40 @@
+import json
+import unittest
+from collections import OrderedDict
+from defs.catalog import DEFAULT_PATH, compileCatalog
+
+
+class CatalogTest(unittest.TestCase):
+    """Checks that catalogs are checked as they are compiled"""
+
+    def setUp(self):
+        with open(DEFAULT_PATH, 'rb') as f:
+            self.source = f.read()
+
+    # The catalog as it is, with an operon added.
+    def withOperon(self, op):
+        data = json.loads(self.source, object_pairs_hook=OrderedDict)
+        data['operons'].append(op)
+        return json.dumps(data)
+
+    def testDefaultCatalogCompiles(self):
+        compiled = compileCatalog(self.source)
+        self.assertTrue(compiled['operons'])
+
+    # Transporters can only move resources that are found outside the cell.
+    def testTransporterOfCellResourceIsRejected(self):
+        for func in ('pas', 'act'):
+            source = self.withOperon({"name": "ATP Pump", "size": 100000, "type": func, "effect": "ATP"})
+            self.assertRaises(ValueError, compileCatalog, source)
+
+    def testTransporterOfUnknownResourceIsRejected(self):
+        source = self.withOperon({"name": "Gold Pump", "size": 100000, "type": "act", "effect": "Au"})
+        self.assertRaises(ValueError, compileCatalog, source)
+
+    def testTransporterOfEnvironmentalResourceCompiles(self):
+        source = self.withOperon({"name": "Another O2 Channel", "size": 100, "type": "pas", "effect": "O2"})
+        compiled = compileCatalog(source)
+        self.assertEqual(compiled['operons'][-1][3], 'O2')
+
+if __name__ == '__main__':
+    unittest.main()